@@ -0,0 +1,163 @@
+import sys
+import os
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from jukebox.database import Database
+
+# Schema version 1 as it shipped, with disc and track numbers stored as tag text
+V1_SCHEMA = '''
+    CREATE TABLE artist (ROWID INTEGER NOT NULL, name TEXT, search_name TEXT, play_count INTEGER DEFAULT 0, PRIMARY KEY(ROWID));
+    CREATE UNIQUE INDEX unq_artist_name ON artist(name);
+    CREATE INDEX idx_artist_search_name ON artist(search_name);
+    CREATE TABLE album (ROWID INTEGER NOT NULL, name TEXT, search_name TEXT, artist_id INTEGER, play_count INTEGER DEFAULT 0, PRIMARY KEY(ROWID));
+    CREATE UNIQUE INDEX unq_album_name_artist_id ON album(name, artist_id);
+    CREATE INDEX idx_album_name ON album(name);
+    CREATE INDEX idx_album_search_name ON album(search_name);
+    CREATE INDEX idx_album_artist_id ON album(artist_id);
+    CREATE TABLE song (ROWID INTEGER NOT NULL, name TEXT, search_name TEXT, path TEXT, disc_number TEXT, track_number TEXT,
+                       artist_id INTEGER, album_id INTEGER, play_count INTEGER DEFAULT 0, file_size INTEGER, last_modified REAL, PRIMARY KEY(ROWID));
+    CREATE UNIQUE INDEX unq_song_path ON song(path);
+    CREATE INDEX idx_song_name_artist_id_album_id ON song(name, artist_id, album_id);
+    CREATE INDEX idx_song_name_artist_id ON song(name, artist_id);
+    CREATE INDEX idx_song_name_album_id ON song(name, album_id);
+    CREATE INDEX idx_song_name ON song(name);
+    CREATE INDEX idx_song_search_name ON song(search_name);
+    CREATE INDEX idx_song_album_id ON song(album_id);
+    CREATE INDEX idx_song_artist_id ON song(artist_id);
+'''
+
+# The statements behind the intent lookups, the watcher and the play count writes
+QUERIES = {
+    'songs by album': ("SELECT ROWID FROM song WHERE album_id = ? ORDER BY disc_number, track_number", 'album'),
+    'albums by artist': ("SELECT name FROM album WHERE artist_id = ?", 'artist'),
+    'album by name': ("SELECT album.ROWID FROM album JOIN artist ON artist.ROWID = album.artist_id WHERE album.search_name = ? AND artist.search_name = ?", 'album_name'),
+    'song by path': ("SELECT ROWID FROM song WHERE path = ?", 'path'),
+    'album play count': ("SELECT album_id FROM song WHERE song.ROWID = ?", 'song'),
+}
+
+SONG_COLUMNS = "name, search_name, path, disc_number, track_number, artist_id, album_id, file_size, last_modified"
+
+
+def make_rows(song_count, tracks_per_album, albums_per_artist):
+    album_count = max(1, song_count // tracks_per_album)
+    artist_count = max(1, album_count // albums_per_artist)
+
+    artists = [(artist, 'Artist %s' % artist, 'artist %s' % artist) for artist in range(1, artist_count + 1)]
+    albums = [(album, 'Album %s' % album, 'album %s' % album, (album - 1) % artist_count + 1) for album in range(1, album_count + 1)]
+    songs = []
+
+    for index in range(song_count):
+        album = index % album_count + 1
+        track = index // album_count + 1
+        songs.append(('Song %s' % index, 'song %s' % index, '/music/%s/%s/%02d.mp3' % (albums[album - 1][3], album, track),
+                      '1/1', '%s/%s' % (track, tracks_per_album), albums[album - 1][3], album, 4000000, 1500000000.0))
+
+    # Scanners insert in directory order, not in key order
+    random.Random(1).shuffle(songs)
+    return artists, albums, songs
+
+
+def insert_rows(connection, artists, albums, songs, to_number=None):
+    connection.executemany("INSERT INTO artist (ROWID, name, search_name) VALUES (?, ?, ?)", artists)
+    connection.executemany("INSERT INTO album (ROWID, name, search_name, artist_id) VALUES (?, ?, ?, ?)", albums)
+
+    if to_number is not None:
+        songs = [song[:3] + (to_number(song[3]), to_number(song[4])) + song[5:] for song in songs]
+
+    started = time.perf_counter()
+    connection.executemany("INSERT INTO song (%s) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)" % SONG_COLUMNS, songs)
+    connection.commit()
+
+    return time.perf_counter() - started
+
+
+def time_queries(connection, samples, queries):
+    timings = {}
+
+    for name, (sql, sample) in QUERIES.items():
+        # One untimed pass, so both schemas are measured with the pages they need already cached
+        for params in samples[sample]:
+            connection.execute(sql, params).fetchall()
+
+        started = time.perf_counter()
+        for _ in range(queries):
+            for params in samples[sample]:
+                connection.execute(sql, params).fetchall()
+
+        timings[name] = (time.perf_counter() - started) / (queries * len(samples[sample])) * 1000000
+
+    return timings
+
+
+def index_count(connection):
+    return connection.execute("SELECT count(*) FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('artist', 'album', 'song')").fetchone()[0]
+
+
+def open_database(path):
+    Database.DB_PATH = path
+    return Database(reader_count=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare insert throughput and query latency of schema versions 1 and 2')
+    parser.add_argument('--songs', type=int, default=100000, help='synthetic library size')
+    parser.add_argument('--queries', type=int, default=200, help='rounds of each lookup')
+    args = parser.parse_args()
+
+    artists, albums, songs = make_rows(args.songs, 12, 4)
+    rng = random.Random(2)
+    samples = {
+        'album': [(rng.choice(albums)[0],) for _ in range(10)],
+        'artist': [(rng.choice(artists)[0],) for _ in range(10)],
+        'album_name': [(album[2], artists[album[3] - 1][2]) for album in rng.sample(albums, min(10, len(albums)))],
+        'path': [(song[2],) for song in rng.sample(songs, 10)],
+        'song': [(rng.randint(1, len(songs)),) for _ in range(10)],
+    }
+
+    print("%s songs, %s albums, %s artists" % (len(songs), len(albums), len(artists)))
+    directory = tempfile.mkdtemp()
+
+    try:
+        v1_path = os.path.join(directory, 'v1.db')
+        connection = sqlite3.connect(v1_path)
+        connection.executescript(V1_SCHEMA)
+        v1_insert = insert_rows(connection, artists, albums, songs)
+        connection.execute("ANALYZE")
+        v1_indexes = index_count(connection)
+        v1_queries = time_queries(connection, samples, args.queries)
+        connection.close()
+
+        started = time.perf_counter()
+        migrated = open_database(v1_path)
+        migration = time.perf_counter() - started
+        connection = migrated.get_connection()
+        connection.execute("ANALYZE")
+        v2_queries = time_queries(connection, samples, args.queries)
+
+        # Search triggers are dropped so both inserts pay for the same thing, the b-tree indexes
+        database = open_database(os.path.join(directory, 'v2.db'))
+        database.drop_search_triggers()
+        v2_insert = insert_rows(database.get_connection(), artists, albums, songs, Database.to_number)
+        v2_indexes = index_count(database.get_connection())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print("%-18s %14s %14s" % ('', 'v1', 'v2'))
+    print("%-18s %14s %14s" % ('indexes', v1_indexes, v2_indexes))
+    print("%-18s %10.0f/sec %10.0f/sec" % ('song inserts', len(songs) / v1_insert, len(songs) / v2_insert))
+    for name in QUERIES:
+        print("%-18s %11.1f us %11.1f us" % (name, v1_queries[name], v2_queries[name]))
+
+    print("Migrating v1 to v2 took %.2f s" % migration)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import sys
+import os
+import time
+import socket
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from jukebox.stream import SongStream
+
+
+# Stands in for the file wrapper of a sendfile capable server such as gunicorn
+class SendfileWrapper:
+    def __init__(self, file, buffer_size):
+        self.file = file
+
+    def close(self):
+        self.file.close()
+
+
+def drain(connection, total):
+    received = 0
+    while received < total:
+        data = connection.recv(1048576)
+        if not data:
+            break
+        received += len(data)
+
+
+def send(body, connection, size):
+    if isinstance(body, SendfileWrapper):
+        offset = body.file.tell()
+        while offset < size:
+            offset += os.sendfile(connection.fileno(), body.file.fileno(), offset, size - offset)
+        body.close()
+        return
+
+    for data in body:
+        connection.sendall(data)
+
+
+def stream(path, size, chunk_size, environ):
+    sender, receiver = socket.socketpair()
+    reader = threading.Thread(target=drain, args=(receiver, size))
+    reader.start()
+
+    started, cpu_started = time.perf_counter(), time.thread_time()
+    send(SongStream(path, chunk_size=chunk_size).get_body(open(path, 'rb', buffering=0), environ, 0, size, size), sender, size)
+    elapsed, cpu = time.perf_counter() - started, time.thread_time() - cpu_started
+
+    reader.join()
+    sender.close()
+    receiver.close()
+
+    return elapsed, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare song streaming modes by throughput and CPU time per stream')
+    parser.add_argument('path', nargs='?', help='song to stream, a temporary file is used by default')
+    parser.add_argument('--size', type=int, default=64, help='size in MB of the temporary file')
+    parser.add_argument('--rounds', type=int, default=3, help='best of ROUNDS timings per mode')
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.mp3')
+        with os.fdopen(handle, 'wb') as file:
+            for _ in range(args.size):
+                file.write(os.urandom(1048576))
+
+    size = os.path.getsize(path)
+    modes = [
+        ('1 KiB chunks', 1024, {}),
+        ('64 KiB chunks', 65536, {}),
+        ('%d KiB chunks' % (SongStream.CHUNK_SIZE // 1024), SongStream.CHUNK_SIZE, {}),
+        ('sendfile', SongStream.CHUNK_SIZE, {'wsgi.file_wrapper': SendfileWrapper}),
+    ]
+
+    print("Streaming %.1f MB, best of %s rounds" % (size / 1048576, args.rounds))
+
+    try:
+        for name, chunk_size, environ in modes:
+            # Served from the page cache after the first read, so only the cost of moving bytes is measured
+            elapsed, cpu = min(stream(path, size, chunk_size, environ) for _ in range(args.rounds))
+            print("%-16s %10.1f MB/sec %8.1f ms CPU" % (name, size / 1048576 / elapsed, cpu * 1000))
+    finally:
+        if args.path is None:
+            os.remove(path)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
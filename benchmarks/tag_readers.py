@@ -0,0 +1,65 @@
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from jukebox.ingest import IngestPipeline
+from jukebox.walker import LibraryWalker
+
+FIELDS = ('title', 'disc_number', 'track_number', 'album_name', 'artist_name')
+
+
+def read_all(paths, engine):
+    results = {}
+    started = time.perf_counter()
+
+    for path in paths:
+        try:
+            song = IngestPipeline.read_tags(path, engine)
+        except Exception as error:
+            song = error
+
+        results[path] = tuple(getattr(song, field, None) for field in FIELDS)
+
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the mutagen and fast tag reader engines')
+    parser.add_argument('library_path')
+    parser.add_argument('--limit', type=int, default=None, help='only read the first LIMIT songs')
+    parser.add_argument('--rounds', type=int, default=3, help='best of ROUNDS timings per engine')
+    args = parser.parse_args()
+
+    walker = LibraryWalker(args.library_path, IngestPipeline.MP3_EXTENSIONS + IngestPipeline.MP4_EXTENSIONS)
+    paths = []
+    for path, stat in walker:
+        paths.append(path)
+        if args.limit is not None and len(paths) >= args.limit:
+            break
+
+    print("Reading %s songs, best of %s rounds" % (len(paths), args.rounds))
+
+    timings = {}
+    results = {}
+    for engine in (IngestPipeline.MUTAGEN_ENGINE, IngestPipeline.FAST_ENGINE):
+        for _ in range(args.rounds):
+            results[engine], elapsed = read_all(paths, engine)
+            timings[engine] = min(elapsed, timings.get(engine, elapsed))
+
+        print("%-8s %8.3f s %10.0f songs/sec" % (engine, timings[engine], len(paths) / timings[engine] if timings[engine] else 0))
+
+    mismatches = [path for path in paths if results[IngestPipeline.MUTAGEN_ENGINE][path] != results[IngestPipeline.FAST_ENGINE][path]]
+    for path in mismatches[:10]:
+        print("MISMATCH %s: %s != %s" % (path, results[IngestPipeline.MUTAGEN_ENGINE][path], results[IngestPipeline.FAST_ENGINE][path]))
+
+    if timings[IngestPipeline.FAST_ENGINE] > 0:
+        print("Speedup: %.1fx, %s mismatches" % (timings[IngestPipeline.MUTAGEN_ENGINE] / timings[IngestPipeline.FAST_ENGINE], len(mismatches)))
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from flask import Flask, Response, request, send_file
+from flask import Flask, Response, request, send_file, abort
 from werkzeug.datastructures import Headers
 from flask_ask import Ask
 from time import time
@@ -11,28 +11,41 @@ def init():
 
     library_path = '/home/plex/shares/k/Music/Music'
 
+    from .stream import SongStream
+
     app = Flask(__name__)
+    app.config.setdefault('STREAM_CHUNK_SIZE', SongStream.CHUNK_SIZE)
+    app.config.setdefault('STREAM_FILE_WRAPPER', True)
+    app.config.setdefault('STREAM_MAX_AGE', SongStream.MAX_AGE)
     ask = Ask(app, '/')
 
     from .library import Library
 
     print('Loading library...', file=sys.stderr)
     library = Library(library_path)
+    library.watch()
+    library.track_plays()
+    library.prefetch_songs()
     print('Done loading library!', file=sys.stderr)
 
     from . import selection
     from . import playback
     from . import intents
 
-    @app.route('/songs/<song_id>')
+    @app.route('/songs/<int:song_id>')
     def get_song_stream(song_id):
-        path = library.database.get_song_path_by_song_id(song_id)
+        song_file = library.song_files.get(song_id)
         print("Received request:\n %s" % request.headers, file=sys.stderr)
-        print("Playing %s" % path,file=sys.stderr)
-        def generate():
-            with open(path, "rb") as fmp3:
-                data = fmp3.read(1024)
-                while data:
-                    yield data
-                    data = fmp3.read(1024)
-        return Response(generate(), mimetype="audio/mpeg")
+        print("Playing %s" % (song_file.path if song_file is not None else None), file=sys.stderr)
+
+        if song_file is None:
+            abort(404)
+
+        on_first_byte = None
+        if library.prefetcher is not None:
+            on_first_byte = lambda seconds: library.prefetcher.record_first_byte(song_id, seconds)
+
+        stream = SongStream.from_song_file(song_file, chunk_size=app.config['STREAM_CHUNK_SIZE'],
+                                           file_wrapper=app.config['STREAM_FILE_WRAPPER'], max_age=app.config['STREAM_MAX_AGE'],
+                                           on_first_byte=on_first_byte)
+        return stream.get_response(request)
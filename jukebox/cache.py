@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Returned by get for keys that are not cached, since None is a perfectly good cached result
+    MISSING = object()
+
+    def __init__(self, size, ttl=None, generation=None):
+        self.size = max(0, int(size))
+        self.ttl = ttl
+        # Called to read the library generation; entries from an older generation are all dropped at once
+        self.generation = generation
+        self.current_generation = generation() if generation is not None else None
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            self.check_generation()
+            entry = self.entries.get(key)
+
+            if entry is None or (self.ttl is not None and time.monotonic() - entry[1] > self.ttl):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return self.MISSING
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def put(self, key, value, generation=None):
+        with self.lock:
+            self.check_generation()
+
+            # A value computed before the library changed would outlive the change, so it is not kept
+            if generation is not None and generation != self.current_generation:
+                return self
+
+            if self.size == 0:
+                return self
+
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        return self
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+        return self
+
+    def check_generation(self):
+        if self.generation is None:
+            return
+
+        generation = self.generation()
+        if generation != self.current_generation:
+            self.entries.clear()
+            self.current_generation = generation
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+            }
@@ -0,0 +1,242 @@
+import sys
+import bisect
+from array import array
+from . import grammar
+
+
+# A read-only snapshot of artists, albums and their ordered songs, answering intent lookups without SQLite.
+#
+# Rows are stored column-wise in arrays rather than as objects, with albums and songs grouped under their
+# parent in compressed sparse row form (offsets into a flat index), so the cost per row is fixed:
+#   song    16 bytes (id, disc and track), only songs are held for the play order
+#   album   ~20 bytes of arrays plus its interned name and search name, and a slot in the name table
+#   artist  ~12 bytes of arrays plus its interned name and search name, and a slot in the name table
+# A library of 500k songs, 40k albums and 5k artists comes to roughly 8 MB of song arrays and 10-15 MB of
+# album and artist names, about 25 MB in total. Libraries above MAX_SONGS are not loaded at all.
+class Catalog:
+    MAX_SONGS=2000000
+
+    def __init__(self, database):
+        self.database = database
+        self.generation = None
+        self.loaded = False
+
+        self.artist_ids = array('q')
+        self.artist_names = []
+        self.artist_search_names = []
+        self.artist_album_offsets = array('i', [0])
+        self.artist_album_index = array('i')
+        self.artist_positions = {}
+
+        self.album_ids = array('q')
+        self.album_names = []
+        self.album_search_names = []
+        self.album_artists = array('i')
+        self.album_song_offsets = array('i', [0])
+        self.album_positions = {}
+
+        self.song_ids = array('q')
+        self.song_discs = array('i')
+        self.song_tracks = array('i')
+
+    @classmethod
+    def load(cls, database):
+        catalog = cls(database)
+        # Read first: changes that land while loading leave the snapshot stale, so it is simply loaded again
+        catalog.generation = database.generation
+
+        song_count = database.fetch_one("SELECT count(*) FROM song")[0]
+        if song_count > cls.MAX_SONGS:
+            print("Library has %s songs, answering lookups from the database only" % song_count, file=sys.stderr)
+            return catalog
+
+        return catalog.load_artists().load_albums().load_songs()
+
+    def load_artists(self):
+        for artist_id, name, search_name in self.database.fetch_each("SELECT ROWID, name, search_name FROM artist ORDER BY ROWID"):
+            position = len(self.artist_ids)
+            self.artist_ids.append(artist_id)
+            self.artist_names.append(self.intern(name))
+            self.artist_search_names.append(self.intern(search_name))
+            self.add_position(self.artist_positions, search_name, position)
+
+        return self
+
+    def load_albums(self):
+        album_counts = [0] * len(self.artist_ids)
+
+        for album_id, name, search_name, artist_id in self.database.fetch_each("SELECT ROWID, name, search_name, artist_id FROM album ORDER BY ROWID"):
+            artist_position = self.find(self.artist_ids, artist_id)
+            if artist_position is None:
+                continue
+
+            position = len(self.album_ids)
+            self.album_ids.append(album_id)
+            self.album_names.append(self.intern(name))
+            self.album_search_names.append(self.intern(search_name))
+            self.album_artists.append(artist_position)
+            self.add_position(self.album_positions, search_name, position)
+            album_counts[artist_position] += 1
+
+        # Group album positions by artist with a counting sort
+        for count in album_counts:
+            self.artist_album_offsets.append(self.artist_album_offsets[-1] + count)
+
+        next_slot = array('i', self.artist_album_offsets[:-1])
+        self.artist_album_index = array('i', bytes(4 * len(self.album_ids)))
+
+        for position, artist_position in enumerate(self.album_artists):
+            self.artist_album_index[next_slot[artist_position]] = position
+            next_slot[artist_position] += 1
+
+        return self
+
+    def load_songs(self):
+        album_counts = [0] * len(self.album_ids)
+        position = 0
+
+        cursor = self.database.fetch_each('''
+            SELECT ROWID, album_id, coalesce(disc_number, 0), coalesce(track_number, 0)
+            FROM song ORDER BY album_id, disc_number, track_number, ROWID
+        ''')
+
+        # Songs come sorted by album and both tables are in ROWID order, so the two are merged in a single pass
+        for song_id, album_id, disc, track in cursor:
+            while position < len(self.album_ids) and self.album_ids[position] < album_id:
+                position += 1
+
+            if position == len(self.album_ids) or self.album_ids[position] != album_id:
+                continue
+
+            self.song_ids.append(song_id)
+            self.song_discs.append(disc)
+            self.song_tracks.append(track)
+            album_counts[position] += 1
+
+        for count in album_counts:
+            self.album_song_offsets.append(self.album_song_offsets[-1] + count)
+
+        self.loaded = True
+        return self
+
+    def is_stale(self):
+        return self.generation != self.database.generation
+
+    def get_artist_name(self, artist_name):
+        if self.loaded and artist_name is not None:
+            positions = self.artist_positions.get(grammar.strip_articles(artist_name), ())
+            if len(positions) == 1:
+                return self.artist_names[positions[0]]
+
+        return self.database.get_artist_name(artist_name)
+
+    def get_album_id_by_album_artist(self, album_name, artist_name=None):
+        if self.loaded and album_name is not None:
+            positions = self.album_positions.get(grammar.strip_articles(album_name), ())
+
+            if artist_name is not None:
+                search_artist_name = grammar.strip_articles(artist_name)
+                positions = [position for position in positions if self.artist_search_names[self.album_artists[position]] == search_artist_name]
+
+            if len(positions) > 0:
+                return self.album_ids[positions[0]]
+
+            # Misheard names go to the in-memory match index, and only then to the database's wildcard queries
+            matches = self.database.match_albums(album_name, artist_name)
+            if len(matches) > 0 and self.find(self.album_ids, matches[0][0]) is not None:
+                return matches[0][0]
+
+        return self.database.get_album_id_by_album_artist(album_name, artist_name, False, False)
+
+    def get_artist_name_by_album_id(self, album_id):
+        position = self.find(self.album_ids, album_id)
+        if position is None:
+            return self.database.get_artist_name_by_album_id(album_id)
+
+        return self.artist_names[self.album_artists[position]]
+
+    def get_album_name_by_album_id(self, album_id):
+        position = self.find(self.album_ids, album_id)
+        if position is None:
+            return self.database.get_album_name_by_album_id(album_id)
+
+        return self.album_names[position]
+
+    def get_songs_by_album_id(self, album_id):
+        position = self.find(self.album_ids, album_id)
+        if position is None:
+            return self.database.get_songs_by_album_id(album_id)
+
+        songs = self.song_ids[self.album_song_offsets[position]:self.album_song_offsets[position + 1]]
+        if len(songs) == 0:
+            return None
+
+        return list(songs)
+
+    def get_album_bundle(self, album_name, artist_name=None):
+        return self.get_album_bundles([(album_name, artist_name)])[0]
+
+    def get_album_bundles(self, requests):
+        bundles = []
+        missing = []
+
+        for album_name, artist_name in requests:
+            position = None
+            if album_name is not None:
+                position = self.find(self.album_ids, self.get_album_id_by_album_artist(album_name, artist_name))
+
+            if position is None:
+                missing.append((len(bundles), album_name, artist_name))
+                bundles.append(None)
+                continue
+
+            start, end = self.album_song_offsets[position], self.album_song_offsets[position + 1]
+            songs = list(zip(self.song_ids[start:end], self.song_discs[start:end], self.song_tracks[start:end]))
+            bundles.append((self.album_ids[position], self.album_names[position], self.artist_names[self.album_artists[position]], songs))
+
+        # Albums added since the snapshot was taken
+        if len(missing) > 0:
+            found = self.database.get_album_bundles([(album_name, artist_name) for _, album_name, artist_name in missing])
+
+            for (index, _, _), bundle in zip(missing, found):
+                bundles[index] = bundle
+
+        return bundles
+
+    def get_all_albums_by_artist(self, artist_name):
+        if self.loaded and artist_name is not None:
+            positions = self.artist_positions.get(grammar.strip_articles(artist_name), ())
+
+            if len(positions) == 0:
+                matches = self.database.match_artists(artist_name)
+                positions = [self.find(self.artist_ids, matches[0][0])] if len(matches) > 0 else []
+
+            albums = [self.album_names[album]
+                      for artist in positions if artist is not None
+                      for album in self.artist_album_index[self.artist_album_offsets[artist]:self.artist_album_offsets[artist + 1]]]
+
+            if len(albums) > 0:
+                return albums
+
+        return self.database.get_all_albums_by_artist(artist_name)
+
+    @staticmethod
+    def find(ids, key):
+        if key is None:
+            return None
+
+        index = bisect.bisect_left(ids, key)
+        if index < len(ids) and ids[index] == key:
+            return index
+
+        return None
+
+    @staticmethod
+    def add_position(positions, search_name, position):
+        # Almost every name is unique, so a bare tuple per name is cheaper than a list
+        if search_name is not None:
+            positions[search_name] = positions.get(search_name, ()) + (position,)
+
+    @staticmethod
+    def intern(value):
+        return sys.intern(value) if value is not None else None
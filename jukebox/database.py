@@ -1,19 +1,88 @@
 import sys
+import os
+import re
 import threading
 import time
 import sqlite3
 from queue import Queue
 from types import SimpleNamespace
 from . import grammar
+from .pathset import PathSet
+from .pool import ConnectionPool
+from .matcher import NameMatcher
+from .cache import LRUCache
+from .query import DbAdapter
 from .mp3 import MP3Object
 from .mp4 import MP4Object
 
 class Database:
     DB_PATH='database/library.db'
 
-    def __init__(self):
+    # Page cache used during bulk loads, in KiB
+    BULK_CACHE_SIZE=262144
+    BULK_COMMIT_ROWS=50000
+
+    # Read-only connections shared by request threads, and how long a statement waits on a lock, in milliseconds
+    READER_COUNT=4
+    BUSY_TIMEOUT=5000
+
+    # Stored in PRAGMA user_version; databases from older releases are migrated on open
+    SCHEMA_VERSION=2
+
+    # Non-unique indexes, which bulk loads drop and rebuild once all rows are in. Each one serves a query the
+    # library actually runs, and the album and song ones cover them, so those never touch the table itself
+    SECONDARY_INDEXES = {
+        'idx_artist_search_name': 'artist(search_name)',
+        'idx_album_search_name': 'album(search_name)',
+        'idx_album_artist_id_name': 'album(artist_id, name)',
+        'idx_song_album_id_disc_number_track_number': 'song(album_id, disc_number, track_number)',
+    }
+
+    # Indexes from schema v1 that no query used, or that are prefixes of the covering indexes above
+    OBSOLETE_INDEXES = (
+        'idx_album_name',
+        'idx_album_artist_id',
+        'idx_song_name_artist_id_album_id',
+        'idx_song_name_artist_id',
+        'idx_song_name_album_id',
+        'idx_song_name',
+        'idx_song_search_name',
+        'idx_song_album_id',
+        'idx_song_artist_id',
+    )
+
+    # Leading number of tags such as "3/12"
+    NUMBER_PATTERN = re.compile(r'\s*(\d+)')
+
+    # Tables whose search_name is mirrored into an FTS5 index named <table>_fts, kept in sync by triggers
+    SEARCH_TABLES = ('artist', 'album', 'song')
+    SEARCH_TOKENIZER = 'unicode61 remove_diacritics 2'
+
+    # Ranked fuzzy candidates considered per lookup, and how much the artist counts towards an album match
+    MATCH_CANDIDATES=20
+    ARTIST_MATCH_WEIGHT=0.4
+
+    # Voice lookups cached per normalized name, and for how many seconds
+    LOOKUP_CACHE_SIZE=1024
+    LOOKUP_CACHE_TTL=600.0
+
+    # Keeps batched statements under SQLite's limit on bound parameters
+    PARAMETER_BATCH_SIZE=300
+
+    def __init__(self, reader_count=READER_COUNT, busy_timeout=BUSY_TIMEOUT, cache_size=LOOKUP_CACHE_SIZE, cache_ttl=LOOKUP_CACHE_TTL):
+        self.busy_timeout = busy_timeout
         self.song_queue = Queue()
         self.song_count = 0
+        self.artist_ids = None
+        self.album_ids = None
+        self.known_paths = None
+        self.rows_written = 0
+        self.bulk_loading = False
+        self.full_text_search = False
+        # Bumped on every change to the library, so snapshots and caches can tell they are stale
+        self.generation = 0
+        # Serializes writers, e.g. a manual build_library running alongside the library watcher
+        self.lock = threading.RLock()
 
         try:
             open(self.DB_PATH)
@@ -26,18 +95,49 @@ class Database:
             print('Done', file=sys.stderr)
             sys.stderr.flush()
 
+        self.upgrade_database()
+
+        self.readers = ConnectionPool(self.DB_PATH, reader_count, busy_timeout)
+        self.adapter = DbAdapter(self.DB_PATH, self.readers)
+        self.load_matchers()
+        self.lookup_cache = LRUCache(cache_size, cache_ttl, lambda: self.generation)
+
     def __del__(self):
+        if hasattr(self, 'readers'):
+            self.readers.close()
+
         if hasattr(self, 'connection'):
             self.connection.close()
 
+    # The single writer connection; ingest and the watcher serialize on self.lock before writing through it
     def get_connection(self):
         if hasattr(self, 'connection'):
             return self.connection
 
-        self.connection = sqlite3.connect(self.DB_PATH)
+        self.connection = sqlite3.connect(self.DB_PATH, check_same_thread=False, timeout=self.busy_timeout / 1000,
+                                          cached_statements=ConnectionPool.CACHED_STATEMENTS)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA busy_timeout = %d" % self.busy_timeout)
 
         return self.connection
 
+    def select(self):
+        return self.adapter.select()
+
+    def fetch_all(self, sql, parameters=()):
+        with self.readers.connection() as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+    def fetch_each(self, sql, parameters=()):
+        # Keeps the connection leased until the rows are consumed, so large results are never held in memory at once
+        with self.readers.connection() as connection:
+            for row in connection.execute(sql, parameters):
+                yield row
+
+    def fetch_one(self, sql, parameters=()):
+        with self.readers.connection() as connection:
+            return connection.execute(sql, parameters).fetchone()
+
     def get_cursor(self):
         if hasattr(self, 'cursor'):
             return self.cursor
@@ -49,6 +149,94 @@ class Database:
         self.create_table_artists()
         self.create_table_albums()
         self.create_table_songs()
+        self.set_schema_version(self.SCHEMA_VERSION)
+
+    def upgrade_database(self):
+        if self.get_schema_version() < 2:
+            self.migrate_to_v2()
+
+        columns = [row[1] for row in self.get_connection().execute("PRAGMA table_info(song)").fetchall()]
+
+        if 'file_size' not in columns:
+            self.get_connection().execute("ALTER TABLE song ADD COLUMN file_size INTEGER")
+
+        if 'last_modified' not in columns:
+            self.get_connection().execute("ALTER TABLE song ADD COLUMN last_modified REAL")
+
+        self.get_connection().execute('''
+            CREATE TABLE IF NOT EXISTS scan_checkpoint (
+                directory TEXT NOT NULL,
+                PRIMARY KEY(directory)
+            );
+        ''')
+
+        # Fingerprints of files without usable tags, so incremental scans only re-read them once they change
+        self.get_connection().execute('''
+            CREATE TABLE IF NOT EXISTS unusable_file (
+                path TEXT NOT NULL,
+                last_modified REAL,
+                file_size INTEGER,
+                PRIMARY KEY(path)
+            );
+        ''')
+
+        # Puts back indexes dropped by a bulk load that never finished
+        self.create_secondary_indexes()
+        self.create_search_indexes()
+
+        self.get_connection().commit()
+        return self
+
+    def get_schema_version(self):
+        return self.get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+    def set_schema_version(self, version):
+        self.get_connection().execute("PRAGMA user_version = %d" % version)
+        self.get_connection().commit()
+        return self
+
+    # Stores disc and track numbers as integers, so "10" sorts after "2", and swaps the v1 indexes for covering ones
+    def migrate_to_v2(self):
+        print('Upgrading database to schema version 2... ', file=sys.stderr, end='')
+        sys.stderr.flush()
+
+        connection = self.get_connection()
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(song)").fetchall()]
+
+        with self.lock:
+            if connection.in_transaction:
+                connection.commit()
+
+            try:
+                connection.execute("BEGIN")
+
+                # Indexes keep their names when their table is renamed, so they are dropped first
+                for name in self.OBSOLETE_INDEXES + ('unq_song_path',):
+                    connection.execute("DROP INDEX IF EXISTS %s" % name)
+
+                # SQLite cannot change a column's type in place, so the table is copied; the search triggers
+                # go with the old table and are put back, with a rebuilt index, by create_search_indexes
+                connection.execute("ALTER TABLE song RENAME TO song_v1")
+                self.create_table_songs(commit=False)
+                connection.execute('''
+                    INSERT INTO song (ROWID, name, search_name, path, disc_number, track_number, artist_id, album_id, play_count, file_size, last_modified)
+                    SELECT ROWID, name, search_name, path,
+                        CASE WHEN trim(disc_number) GLOB '[0-9]*' THEN CAST(trim(disc_number) AS INTEGER) END,
+                        CASE WHEN trim(track_number) GLOB '[0-9]*' THEN CAST(trim(track_number) AS INTEGER) END,
+                        artist_id, album_id, play_count, %s, %s
+                    FROM song_v1
+                ''' % ('file_size' if 'file_size' in columns else 'NULL', 'last_modified' if 'last_modified' in columns else 'NULL'))
+                connection.execute("DROP TABLE song_v1")
+                self.create_secondary_indexes()
+                connection.execute("PRAGMA user_version = 2")
+                connection.commit()
+            except sqlite3.Error:
+                connection.rollback()
+                raise
+
+        print('Done', file=sys.stderr)
+        sys.stderr.flush()
+        return self
 
     def create_table_artists(self):
         self.get_connection().execute('''
@@ -61,7 +249,7 @@ class Database:
             );
         ''')
         self.get_connection().execute('''CREATE UNIQUE INDEX unq_artist_name ON artist(name)''')
-        self.get_connection().execute('''CREATE INDEX idx_artist_search_name ON artist(search_name)''')
+        self.create_secondary_indexes('artist')
         self.get_connection().commit()
         return self
 
@@ -69,7 +257,7 @@ class Database:
         self.get_cursor().execute('''
             CREATE TABLE album (
                 ROWID INTEGER NOT NULL,
-                name TEXT,@
+                name TEXT,
                 search_name TEXT,
                 artist_id INTEGER,
                 play_count INTEGER DEFAULT 0,
@@ -77,54 +265,206 @@ class Database:
              );
         ''')
         self.get_connection().execute('''CREATE UNIQUE INDEX unq_album_name_artist_id ON album(name, artist_id)''')
-        self.get_connection().execute('''CREATE INDEX idx_album_name ON album(name)''')
-        self.get_connection().execute('''CREATE INDEX idx_album_search_name ON album(search_name)''')
-        self.get_connection().execute('''CREATE INDEX idx_album_artist_id ON album(artist_id)''')
+        self.create_secondary_indexes('album')
         self.get_connection().commit()
         return self
 
-    def create_table_songs(self):
+    def create_table_songs(self, commit=True):
         self.get_connection().execute('''
             CREATE TABLE song (
                 ROWID INTEGER NOT NULL,
                 name TEXT,
                 search_name TEXT,
                 path TEXT,
-                disc_number TEXT,
-                track_number TEXT,
+                disc_number INTEGER,
+                track_number INTEGER,
                 artist_id INTEGER,
                 album_id INTEGER,
                 play_count INTEGER DEFAULT 0,
+                file_size INTEGER,
+                last_modified REAL,
                 PRIMARY KEY(ROWID)
             );
         ''')
         self.get_connection().execute('''CREATE UNIQUE INDEX unq_song_path ON song(path)''')
-        self.get_connection().execute('''CREATE INDEX idx_song_name_artist_id_album_id ON song(name, artist_id, album_id)''')
-        self.get_connection().execute('''CREATE INDEX idx_song_name_artist_id ON song(name, artist_id)''')
-        self.get_connection().execute('''CREATE INDEX idx_song_name_album_id ON song(name, album_id)''')
-        self.get_connection().execute('''CREATE INDEX idx_song_name ON song(name)''')
-        self.get_connection().execute('''CREATE INDEX idx_song_search_name ON song(search_name)''')
-        self.get_connection().execute('''CREATE INDEX idx_song_album_id ON song(album_id)''')
-        self.get_connection().execute('''CREATE INDEX idx_song_artist_id ON song(artist_id)''')
+        self.create_secondary_indexes('song')
+
+        if commit:
+            self.get_connection().commit()
+
+        return self
+
+    def create_secondary_indexes(self, table=None):
+        for name, definition in self.SECONDARY_INDEXES.items():
+            if table is None or definition.startswith(table + '('):
+                self.get_connection().execute("CREATE INDEX IF NOT EXISTS %s ON %s" % (name, definition))
+
+        return self
+
+    def drop_secondary_indexes(self):
+        for name in self.SECONDARY_INDEXES:
+            self.get_connection().execute("DROP INDEX IF EXISTS %s" % name)
+
+        return self
+
+    def create_search_indexes(self):
+        connection = self.get_connection()
+
+        for table in self.SEARCH_TABLES:
+            exists = self.schema_object_exists('table', table + '_fts')
+            # Triggers are dropped during bulk loads, so without them the index has missed rows and is rebuilt
+            synced = self.schema_object_exists('trigger', 'trg_%s_fts_insert' % table)
+
+            if not exists:
+                try:
+                    connection.execute("CREATE VIRTUAL TABLE %s_fts USING fts5(search_name, content='%s', content_rowid='ROWID', tokenize='%s')"
+                                       % (table, table, self.SEARCH_TOKENIZER))
+                except sqlite3.OperationalError as error:
+                    # SQLite built without FTS5: fuzzy lookups keep using LIKE
+                    print("Full-text search unavailable: %s" % error, file=sys.stderr)
+                    self.full_text_search = False
+                    return self
+
+            connection.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_{0}_fts_insert AFTER INSERT ON {0} BEGIN
+                    INSERT INTO {0}_fts (rowid, search_name) VALUES (new.ROWID, new.search_name);
+                END
+            '''.format(table))
+            connection.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_{0}_fts_delete AFTER DELETE ON {0} BEGIN
+                    INSERT INTO {0}_fts ({0}_fts, rowid, search_name) VALUES ('delete', old.ROWID, old.search_name);
+                END
+            '''.format(table))
+            connection.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_{0}_fts_update AFTER UPDATE OF search_name ON {0} BEGIN
+                    INSERT INTO {0}_fts ({0}_fts, rowid, search_name) VALUES ('delete', old.ROWID, old.search_name);
+                    INSERT INTO {0}_fts (rowid, search_name) VALUES (new.ROWID, new.search_name);
+                END
+            '''.format(table))
+
+            if not exists or not synced:
+                connection.execute("INSERT INTO {0}_fts ({0}_fts) VALUES ('rebuild')".format(table))
+
+        self.full_text_search = True
+        return self
+
+    def schema_object_exists(self, object_type, name):
+        return self.get_connection().execute("SELECT count(*) FROM sqlite_master WHERE type = ? AND name = ?", (object_type, name)).fetchone()[0] > 0
+
+    def drop_search_triggers(self):
+        for table in self.SEARCH_TABLES:
+            for event in ('insert', 'delete', 'update'):
+                self.get_connection().execute("DROP TRIGGER IF EXISTS trg_%s_fts_%s" % (table, event))
+
+        return self
+
+    def match_expression(self, search_name):
+        # Each word has to start a word of the name, so "beat" finds "beatles" but "tles" does not
+        tokens = re.findall(r'\w+', search_name.lower())
+        if len(tokens) == 0:
+            # An empty phrase matches nothing
+            return '""'
+
+        return " ".join('"%s"*' % token for token in tokens)
+
+    def is_empty(self):
+        return self.get_connection().execute("SELECT count(*) FROM song").fetchone()[0] == 0
+
+    def begin_bulk_load(self):
+        with self.lock:
+            connection = self.get_connection()
+            connection.commit()
+
+            # Durability matters little while a database is first being filled: a crash just means rebuilding it
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("PRAGMA temp_store = MEMORY")
+            connection.execute("PRAGMA cache_size = -%d" % self.BULK_CACHE_SIZE)
+
+            self.drop_secondary_indexes()
+            self.drop_search_triggers()
+            connection.commit()
+
+            self.bulk_loading = True
+            self.bulk_load_started = time.monotonic()
+            self.bulk_load_rows = self.rows_written
+            self.bulk_committed_rows = self.rows_written
+
+        return self
+
+    def end_bulk_load(self):
+        with self.lock:
+            if not self.bulk_loading:
+                return self
+
+            self.bulk_loading = False
+            connection = self.get_connection()
+            connection.commit()
+
+            rows = self.rows_written - self.bulk_load_rows
+            elapsed = time.monotonic() - self.bulk_load_started
+            print("\nLoaded %s songs in %.1f seconds (%.0f rows/sec)" % (rows, elapsed, rows / elapsed if elapsed > 0 else 0), file=sys.stderr)
+
+            print("Creating indexes... ", file=sys.stderr, end='')
+            sys.stderr.flush()
+            index_started = time.monotonic()
+
+            self.create_secondary_indexes()
+            self.create_search_indexes()
+            connection.commit()
+            connection.execute("ANALYZE")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA cache_size = -2000")
+            connection.commit()
+
+            print("Done in %.1f seconds" % (time.monotonic() - index_started), file=sys.stderr)
+
+        return self
+
+    def changed(self):
+        self.generation += 1
+        return self
+
+    def commit(self):
+        # Bulk loads only commit every BULK_COMMIT_ROWS rows, which is cheap with synchronous off,
+        # so scan checkpoints still become durable along the way
+        if self.bulk_loading and self.rows_written - self.bulk_committed_rows < self.BULK_COMMIT_ROWS:
+            return self
+
         self.get_connection().commit()
+        self.bulk_committed_rows = self.rows_written
+
         return self
 
     def flush_song_queue(self):
-        songs_processed = self.song_count
-        self.song_count += self.song_queue.qsize()
-        rows = []
-
-        current_artist_name = None
-        current_album_name = None
+        songs = []
 
         while not self.song_queue.empty():
-            songs_processed += 1
-            print("\rProcessing song %s / %s" % (songs_processed, self.song_count), end='', file=sys.stderr)
-            sys.stderr.flush()
+            songs.append(self.song_queue.get())
+
+        return self.write_songs(songs)
+
+    # Unusable files are (path, last_modified, file_size) tuples, recorded along with songs that have no tags
+    def write_songs(self, songs, completed_directories=(), unusable=()):
+        with self.lock:
+            return self._write_songs(songs, completed_directories, unusable)
 
-            song = self.song_queue.get()
+    def _write_songs(self, songs, completed_directories=(), unusable=()):
+        self.song_count += len(songs)
+        print("\rProcessing song %s" % self.song_count, end='', file=sys.stderr)
+        sys.stderr.flush()
 
-            if not hasattr(song, 'title') or self.file_path_exists_in_database(song.path):
+        self.load_id_caches()
+
+        artist_rows = []
+        album_rows = []
+        rows = []
+        update_rows = []
+        unusable_rows = [tuple(file) for file in unusable]
+
+        for song in songs:
+            if not hasattr(song, 'title'):
+                unusable_rows.append((song.path, getattr(song, 'last_modified', None), getattr(song, 'file_size', None)))
                 continue
 
             try:
@@ -134,25 +474,162 @@ class Database:
             except:
                 print('ERROR getting info for %s' % song.title, file=sys.stderr)
 
-            if song.artist_name != current_artist_name:
-                artist_id = self.get_artist_id(song)
-                current_artist_name = song.artist_name
-                
-            song.artist_id = artist_id
+            song.artist_id = self.artist_ids.get(song.artist_name)
+            if song.artist_id is None:
+                song.artist_id = self.allocate_artist_id(song)
+                artist_rows.append((song.artist_id, song.artist_name, song.artist_search_name))
+
+            song.album_id = self.album_ids.get((song.album_name, song.artist_id))
+            if song.album_id is None:
+                song.album_id = self.allocate_album_id(song)
+                album_rows.append((song.album_id, song.album_name, song.album_search_name, song.artist_id))
+
+            if self.is_known_path(song.path):
+                update_rows.append(self.song_to_update_array(song))
+            else:
+                rows.append(self.song_to_array(song))
+
+        # New artists, albums and songs all land in a single transaction
+        try:
+            self.get_connection().executemany("INSERT INTO artist (ROWID, name, search_name) VALUES (?, ?, ?)", artist_rows)
+            self.get_connection().executemany("INSERT INTO album (ROWID, name, search_name, artist_id) VALUES (?, ?, ?, ?)", album_rows)
+            self.insert_song_rows(rows, False)
+            self.update_song_rows(update_rows, False)
+            # A path is either a song or unusable; a song whose tags were removed is dropped from the library
+            stale_paths = [(row[0],) for row in unusable_rows if self.is_known_path(row[0])]
+            self.get_connection().executemany("DELETE FROM song WHERE path = ?", stale_paths)
+            self.get_connection().executemany("INSERT OR REPLACE INTO unusable_file (path, last_modified, file_size) VALUES (?, ?, ?)",
+                                              unusable_rows)
+            self.get_connection().executemany("DELETE FROM unusable_file WHERE path = ?", [(row[2],) for row in rows])
+            self.get_connection().executemany("INSERT OR IGNORE INTO scan_checkpoint (directory) VALUES (?)",
+                                              [(directory,) for directory in completed_directories])
+            self.rows_written += len(rows) + len(update_rows)
+            self.commit()
+        except:
+            self.get_connection().rollback()
+            self.reset_id_caches()
+            self.known_paths = None
+            raise
+
+        for row in rows:
+            self.known_paths.add(row[2])
+
+        for path, in stale_paths:
+            self.known_paths.discard(path)
+
+        for artist_id, name, search_name in artist_rows:
+            self.artist_matcher.add(artist_id, search_name)
+
+        for album_id, name, search_name, artist_id in album_rows:
+            self.album_matcher.add(album_id, search_name)
+            self.album_artists[album_id] = artist_id
+
+        if len(rows) > 0 or len(update_rows) > 0 or len(stale_paths) > 0:
+            self.changed()
+
+        if len(update_rows) > 0 or len(stale_paths) > 0:
+            self.delete_orphans()
+
+        return self
+
+    def load_matchers(self):
+        connection = self.get_connection()
+
+        self.artist_matcher = NameMatcher(connection.execute("SELECT ROWID, search_name FROM artist WHERE search_name IS NOT NULL"))
+        self.album_matcher = NameMatcher()
+        self.album_artists = {}
+
+        for album_id, search_name, artist_id in connection.execute("SELECT ROWID, search_name, artist_id FROM album WHERE search_name IS NOT NULL"):
+            self.album_matcher.add(album_id, search_name)
+            self.album_artists[album_id] = artist_id
+
+        return self
+
+    def match_artists(self, artist_name):
+        return self.artist_matcher.match(grammar.strip_articles(artist_name), self.MATCH_CANDIDATES)
+
+    def match_albums(self, album_name, artist_name=None):
+        matches = self.album_matcher.match(grammar.strip_articles(album_name), self.MATCH_CANDIDATES)
+
+        if artist_name is None or len(matches) == 0:
+            return matches
+
+        # Only albums by an artist that matches at all are candidates, so a common title ("Greatest Hits") never
+        # plays another artist's album; among those, a slightly misheard artist is fine if the album matches well
+        artist_scores = dict(self.match_artists(artist_name))
+        ranked = []
+
+        for album_id, score in matches:
+            artist_score = artist_scores.get(self.album_artists.get(album_id))
+            if artist_score is None:
+                continue
+
+            score = (1 - self.ARTIST_MATCH_WEIGHT) * score + self.ARTIST_MATCH_WEIGHT * artist_score
+            if score >= self.album_matcher.MIN_SCORE:
+                ranked.append((album_id, score))
+
+        ranked.sort(key=lambda match: match[1], reverse=True)
+
+        return ranked
+
+    def load_id_caches(self):
+        self.load_known_paths()
+
+        if self.artist_ids is not None:
+            return self
+
+        connection = self.get_connection()
+        self.artist_ids = {row[0]: row[1] for row in connection.execute("SELECT name, ROWID FROM artist")}
+        self.album_ids = {(row[0], row[1]): row[2] for row in connection.execute("SELECT name, artist_id, ROWID FROM album")}
+        self.next_artist_id = connection.execute("SELECT IFNULL(MAX(ROWID), 0) + 1 FROM artist").fetchone()[0]
+        self.next_album_id = connection.execute("SELECT IFNULL(MAX(ROWID), 0) + 1 FROM album").fetchone()[0]
+
+        return self
+
+    def load_known_paths(self):
+        if self.known_paths is not None:
+            return self
 
-            if song.album_name != current_album_name:
-                album_id = self.get_album_id(song)
-                current_album_name = song.album_name
+        count = self.get_connection().execute("SELECT count(*) FROM song").fetchone()[0]
+        cursor = self.get_connection().execute("SELECT path FROM song")
+        self.known_paths = PathSet((row[0] for row in cursor), count > PathSet.HASHED_THRESHOLD)
 
-            song.album_id = album_id
-            rows.append(self.song_to_array(song))
+        return self
 
-        self.insert_song_rows(rows)
+    def is_known_path(self, path):
+        with self.lock:
+            return path in self.load_known_paths().known_paths
 
+    def reset_id_caches(self):
+        self.artist_ids = None
+        self.album_ids = None
         return self
 
+    def allocate_artist_id(self, song):
+        artist_id = self.next_artist_id
+        self.next_artist_id += 1
+        self.artist_ids[song.artist_name] = artist_id
+        return artist_id
+
+    def allocate_album_id(self, song):
+        album_id = self.next_album_id
+        self.next_album_id += 1
+        self.album_ids[(song.album_name, song.artist_id)] = album_id
+        return album_id
+
     def song_to_array(self, song):
-        return [song.title, song.search_title, song.path, song.disc_number, song.track_number, song.artist_id, song.album_id]
+        return [song.title, song.search_title, song.path, self.to_number(song.disc_number), self.to_number(song.track_number), song.artist_id, song.album_id, song.file_size, song.last_modified]
+
+    def song_to_update_array(self, song):
+        return [song.title, song.search_title, self.to_number(song.disc_number), self.to_number(song.track_number), song.artist_id, song.album_id, song.file_size, song.last_modified, song.path]
+
+    @classmethod
+    def to_number(cls, value):
+        if value is None or isinstance(value, int):
+            return value
+
+        matches = cls.NUMBER_PATTERN.match(str(value))
+        return int(matches.group(1)) if matches is not None else None
 
     def process_song(self, song):
         song.artist_id = self.get_artist_id(song)
@@ -177,6 +654,8 @@ class Database:
 
         cursor = self.get_connection().execute("INSERT INTO artist (name, search_name) VALUES (?, ?)", (song.artist_name, song.artist_search_name))
         self.get_connection().commit()
+        self.reset_id_caches()
+        self.artist_matcher.add(cursor.lastrowid, song.artist_search_name)
 
         return cursor.lastrowid
 
@@ -196,6 +675,9 @@ class Database:
 
         cursor = self.get_connection().execute("INSERT INTO album (name, search_name, artist_id) VALUES (?, ?, ?)", (song.album_name, song.album_search_name, song.artist_id))
         self.get_connection().commit()
+        self.reset_id_caches()
+        self.album_matcher.add(cursor.lastrowid, song.album_search_name)
+        self.album_artists[cursor.lastrowid] = song.artist_id
         return cursor.lastrowid
 
     def get_song_id(self, song):
@@ -209,22 +691,148 @@ class Database:
         return self.insert_song(song)
 
     def insert_song(self, song):
-        self.get_connection().execute('''INSERT INTO song (name, search_name, path, disc_number, track_number, artist_id, album_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)''', (song.title, song.search_title, song.path, song.disc_number, song.track_number, song.artist_id, song.album_id))
+        cursor = self.get_connection().execute('''INSERT INTO song (name, search_name, path, disc_number, track_number, artist_id, album_id, file_size, last_modified)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', self.song_to_array(song))
         self.get_connection().commit()
-        return self.get_cursor().lastrowid
+        self.changed()
+        return cursor.lastrowid
 
-    def insert_song_rows(self, rows):
-        sql = "INSERT INTO song (name, search_name, path, disc_number, track_number, artist_id, album_id) VALUES (?, ?, ?, ?, ?, ?, ?) "
+    def insert_song_rows(self, rows, commit=True):
+        # The unique path index is the backstop for a stale or colliding known-path entry: rows that already
+        # exist are skipped here and updated instead
+        sql = "INSERT OR IGNORE INTO song (name, search_name, path, disc_number, track_number, artist_id, album_id, file_size, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+
+        cursor = self.get_connection().executemany(sql, rows)
+        if cursor.rowcount < len(rows):
+            # Same values in update_song_rows' column order, which takes the path last
+            self.update_song_rows([row[:2] + row[3:] + [row[2]] for row in rows], False)
+
+        if commit:
+            self.commit()
+
+        return self
+
+    def update_song_rows(self, rows, commit=True):
+        sql = '''UPDATE song SET name = ?, search_name = ?, disc_number = ?, track_number = ?, artist_id = ?, album_id = ?, file_size = ?, last_modified = ?
+            WHERE path = ?'''
+
+        cursor = self.get_connection().executemany(sql, rows)
+        if cursor.rowcount < len(rows):
+            insert_sql = "INSERT OR IGNORE INTO song (name, search_name, disc_number, track_number, artist_id, album_id, file_size, last_modified, path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            self.get_connection().executemany(insert_sql, rows)
+
+        if commit:
+            self.commit()
+
+        return self
+
+    def delete_songs_by_path(self, paths):
+        with self.lock:
+            paths = list(paths)
+            self.get_connection().executemany("DELETE FROM song WHERE path = ?", [(path,) for path in paths])
+            self.get_connection().executemany("DELETE FROM unusable_file WHERE path = ?", [(path,) for path in paths])
+            self.commit()
+
+            if self.known_paths is not None:
+                for path in paths:
+                    self.known_paths.discard(path)
+
+            self.changed()
+
+            return self.delete_orphans()
+
+    def move_songs(self, moves):
+        with self.lock:
+            self.get_connection().executemany("UPDATE song SET path = ? WHERE path = ?", [(new_path, old_path) for old_path, new_path in moves])
+            self.commit()
+
+            if self.known_paths is not None:
+                for old_path, new_path in moves:
+                    self.known_paths.discard(old_path)
+                    self.known_paths.add(new_path)
+
+            self.changed()
+
+        return self
+
+    def get_paths_in_directory(self, directory):
+        prefix = directory.rstrip(os.sep) + os.sep
+        # Every path starting with the prefix sorts between it and the same prefix with its separator incremented
+        end = prefix[:-1] + chr(ord(os.sep) + 1)
+        cursor = self.get_connection().execute(
+            "SELECT path FROM song WHERE path >= ? AND path < ? UNION ALL SELECT path FROM unusable_file WHERE path >= ? AND path < ?",
+            (prefix, end, prefix, end))
+
+        return [row[0] for row in cursor.fetchall()]
+
+    def delete_orphans(self):
+        with self.lock:
+            connection = self.get_connection()
+
+            albums = connection.execute(
+                "SELECT ROWID, name, artist_id FROM album WHERE NOT EXISTS (SELECT 1 FROM song WHERE song.album_id = album.ROWID)").fetchall()
+            connection.executemany("DELETE FROM album WHERE ROWID = ?", [(album[0],) for album in albums])
+
+            artists = connection.execute(
+                "SELECT ROWID, name FROM artist WHERE NOT EXISTS (SELECT 1 FROM album WHERE album.artist_id = artist.ROWID)").fetchall()
+            connection.executemany("DELETE FROM artist WHERE ROWID = ?", [(artist[0],) for artist in artists])
+
+            self.commit()
+
+            for album in albums:
+                self.album_matcher.remove(album[0])
+                self.album_artists.pop(album[0], None)
+
+            for artist in artists:
+                self.artist_matcher.remove(artist[0])
+
+            if len(albums) > 0 or len(artists) > 0:
+                self.changed()
+
+            if self.artist_ids is not None:
+                for album in albums:
+                    self.album_ids.pop((album[1], album[2]), None)
+
+                for artist in artists:
+                    self.artist_ids.pop(artist[1], None)
+
+        return self
+
+    # Adds plays per song id to the song and to its album and artist, in one transaction
+    def add_play_counts(self, counts):
+        rows = [(plays, song_id) for song_id, plays in counts.items()]
+
+        with self.lock:
+            connection = self.get_connection()
+
+            try:
+                connection.executemany("UPDATE song SET play_count = play_count + ? WHERE ROWID = ?", rows)
+                connection.executemany("UPDATE album SET play_count = play_count + ? WHERE ROWID = (SELECT album_id FROM song WHERE song.ROWID = ?)", rows)
+                connection.executemany("UPDATE artist SET play_count = play_count + ? WHERE ROWID = (SELECT artist_id FROM song WHERE song.ROWID = ?)", rows)
+                self.commit()
+            except:
+                connection.rollback()
+                raise
+
+        return self
+
+    def get_scan_checkpoints(self):
+        return set(row[0] for row in self.get_connection().execute("SELECT directory FROM scan_checkpoint"))
+
+    def clear_scan_checkpoints(self):
+        with self.lock:
+            self.get_connection().execute("DELETE FROM scan_checkpoint")
+            self.get_connection().commit()
+
+        return self
+
+    # Includes files without usable tags, which are only worth reading again once they change
+    def get_song_fingerprints(self):
+        cursor = self.get_connection().execute(
+            "SELECT path, last_modified, file_size FROM song UNION ALL SELECT path, last_modified, file_size FROM unusable_file")
+
+        return {row[0]: (row[1], row[2]) for row in cursor}
 
-        try:
-            cursor = self.get_connection().executemany(sql, rows)
-            self.get_connection().commit()           
-        except sqlite3.IntegrityError:
-            print('Integrity constraint error, rows dump:', file=sys.stderr)
-            print(rows, file=sys.stderr)
-            sys.exit('Fatal error')
-        
     def file_path_exists_in_database(self, path):
         cursor = self.get_connection().execute(
             " SELECT count(*) FROM song WHERE song.path = ?",
@@ -233,77 +841,110 @@ class Database:
         
         return result > 0
 
+    def cached(self, key, function, *args):
+        generation = self.generation
+        value = self.lookup_cache.get(key)
+
+        if value is LRUCache.MISSING:
+            value = function(*args)
+            self.lookup_cache.put(key, value, generation)
+
+        return value
+
+    def get_lookup_cache_stats(self):
+        return self.lookup_cache.stats()
+
     def get_artist_name(self, artist_search_name, fuzzy = False):
         if artist_search_name is None:
             return None
 
+        return self.cached(('artist_name', grammar.strip_articles(artist_search_name), fuzzy), self.find_artist_name, artist_search_name, fuzzy)
+
+    def find_artist_name(self, artist_search_name, fuzzy = False):
         prepared_search_name = grammar.strip_articles(artist_search_name)
 
+        if fuzzy and self.full_text_search:
+            results = self.fetch_all(
+                "SELECT artist.name FROM artist_fts JOIN artist ON artist.ROWID = artist_fts.rowid WHERE artist_fts MATCH ? ORDER BY bm25(artist_fts) LIMIT 1",
+                (self.match_expression(prepared_search_name),))
+
+            return results[0][0] if len(results) > 0 else None
+
         if not fuzzy:
             operator = "="
         else:
             operator = "like"
             prepared_search_name = "%" + prepared_search_name
 
-        cursor = self.get_connection().execute("SELECT name FROM artist WHERE search_name %s ?" % operator, (prepared_search_name,))
-        results = cursor.fetchall()
+        results = self.fetch_all("SELECT name FROM artist WHERE search_name %s ?" % operator, (prepared_search_name,))
+
+        # Misheard names are resolved from the in-memory match index before falling back to wildcard queries
+        if len(results) == 0 and fuzzy == False:
+            matches = self.match_artists(artist_search_name)
+            if len(matches) > 0:
+                results = self.fetch_all("SELECT name FROM artist WHERE ROWID = ?", (matches[0][0],))
+
         if len(results) > 1:
             return None
         elif len(results) == 0 and fuzzy == False:
-            return self.get_artist_name(artist_search_name, True)
+            return self.find_artist_name(artist_search_name, True)
         elif len(results) == 0:
             return None
 
         return results[0][0]
 
     def get_artist_name_by_album_id(self, album_id):
-        cursor = self.get_connection().execute("SELECT artist.name FROM artist JOIN album ON artist.ROWID = album.artist_id WHERE album.ROWID = ?", (album_id,))
-        return cursor.fetchone()[0]
+        select = self.select().select_from('artist', 'name').join('album', 'artist.ROWID = album.artist_id', None).where('album.ROWID = ?', album_id)
+        return self.adapter.fetch_one(select)
 
     def get_album_name_by_album_id(self, album_id):
-        cursor = self.get_connection().execute("SELECT name FROM album WHERE ROWID = ?", (album_id,))
-        return cursor.fetchone()[0]
+        return self.adapter.fetch_one(self.select().select_from('album', 'name').where('album.ROWID = ?', album_id))
 
     def get_album_id_by_album_artist(self, album_name, artist_name = None, fuzzy_artist = False, fuzzy_album = False):
         if album_name is None:
             return None
 
-        sql = "SELECT album.ROWID FROM album "
-        and_where = []
-        parameters = []
+        key = ('album_id', grammar.strip_articles(album_name), grammar.strip_articles(artist_name) if artist_name is not None else None, fuzzy_artist, fuzzy_album)
+        return self.cached(key, self.find_album_id_by_album_artist, album_name, artist_name, fuzzy_artist, fuzzy_album)
+
+    def find_album_id_by_album_artist(self, album_name, artist_name = None, fuzzy_artist = False, fuzzy_album = False):
+        select = self.select().select_from('album', 'ROWID')
 
         if artist_name is not None:
             search_artist_name = grammar.strip_articles(artist_name)
+            select.join('artist', 'album.artist_id = artist.ROWID', None)
+
             if not fuzzy_artist:
-                operator = "="
+                select.where("artist.search_name = ?", search_artist_name)
+            elif self.full_text_search:
+                select.where("artist.ROWID IN (SELECT rowid FROM artist_fts WHERE artist_fts MATCH ?)", self.match_expression(search_artist_name))
             else:
-                operator = "like"
-                search_artist_name = "%" + search_artist_name + "%"
-
-            sql += "JOIN artist ON album.artist_id = artist.ROWID "
-            and_where.append("artist.search_name %s ?" % operator)
-            parameters.append(search_artist_name)
+                select.where("artist.search_name like ?", "%" + search_artist_name + "%")
         
         search_album_name = grammar.strip_articles(album_name)
 
         if not fuzzy_album:
-            operator = "="
+            select.where("album.search_name = ?", search_album_name)
+        elif self.full_text_search:
+            # Best match first, rather than whichever row the table happens to return first
+            select.join('album_fts', 'album_fts.rowid = album.ROWID', None)
+            select.where("album_fts MATCH ?", self.match_expression(search_album_name))
+            select.order('bm25(album_fts)')
         else:
-            operator = "like"
-            sql_album_name = "%" + search_album_name + "%" 
-    
-        and_where.append("album.search_name %s ?" % operator)
-        parameters.append(search_album_name)
+            select.where("album.search_name like ?", "%" + search_album_name + "%")
+
+        results = self.adapter.fetch_all(select)
 
-        sql += "WHERE " + " AND ".join(and_where)
-        cursor = self.get_connection().execute(sql, parameters)
-        results = cursor.fetchall()
+        if len(results) == 0 and fuzzy_artist == False and fuzzy_album == False:
+            matches = self.match_albums(album_name, artist_name)
+            if len(matches) > 0:
+                return matches[0][0]
 
         if len(results) == 0 and fuzzy_artist == False and artist_name is not None:
-            return self.get_album_id_by_album_artist(album_name, artist_name, True)
+            return self.find_album_id_by_album_artist(album_name, artist_name, True)
 
         if len(results) == 0 and fuzzy_album == False:
-            return self.get_album_id_by_album_artist(album_name, artist_name, True, True)
+            return self.find_album_id_by_album_artist(album_name, artist_name, True, True)
         
         if len(results) == 0:
             print("No results found: %s" % results, file=sys.stderr)
@@ -312,14 +953,21 @@ class Database:
         return results[0][0]
 
     def get_song_path_by_song_id(self, song_id):
-        cursor = self.get_connection().execute("SELECT path FROM song WHERE ROWID = ?", (song_id,))
-        result = cursor.fetchone()
-        
-        return result[0]
+        return self.adapter.fetch_one(self.select().select_from('song', 'path').where('song.ROWID = ?', song_id))
+
+    def get_song_paths(self, song_ids):
+        song_ids = list(song_ids)
+        paths = {}
+
+        for start in range(0, len(song_ids), self.PARAMETER_BATCH_SIZE):
+            batch = song_ids[start:start + self.PARAMETER_BATCH_SIZE]
+            paths.update(self.adapter.fetch_all(self.select().select_from('song', ['ROWID', 'path']).where('song.ROWID IN (?)', batch)))
+
+        return paths
 
     def get_songs_by_album_id(self, album_id):
-        cursor = self.get_connection().execute("SELECT ROWID FROM song WHERE album_id = ? ORDER BY disc_number ASC, track_number ASC", (album_id,))
-        results = cursor.fetchall()
+        select = self.select().select_from('song', 'ROWID').where('song.album_id = ?', album_id).order(['song.disc_number ASC', 'song.track_number ASC'])
+        results = self.adapter.fetch_all(select)
     
         if len(results) == 0:
             return None
@@ -327,24 +975,106 @@ class Database:
         return [result[0] for result in results]
     
 
+    def get_album_bundle(self, album_name, artist_name = None):
+        return self.get_album_bundles([(album_name, artist_name)])[0]
+
+    # Resolves (album name, artist name or None) requests to (album id, album name, artist name, [(song id, disc, track)])
+    # with one query for every exact match and one for all of their songs; unmatched requests come back as None
+    def get_album_bundles(self, requests):
+        requests = [(album_name, artist_name) for album_name, artist_name in requests]
+        albums = [None] * len(requests)
+
+        for start in range(0, len(requests), self.PARAMETER_BATCH_SIZE):
+            batch = requests[start:start + self.PARAMETER_BATCH_SIZE]
+            values = []
+            parameters = []
+
+            for position, (album_name, artist_name) in enumerate(batch, start):
+                if album_name is None:
+                    continue
+
+                values.append("(?, ?, ?)")
+                parameters.extend([position, grammar.strip_articles(album_name), grammar.strip_articles(artist_name) if artist_name is not None else None])
+
+            if len(values) == 0:
+                continue
+
+            rows = self.fetch_all('''
+                WITH request (position, album_search_name, artist_search_name) AS (VALUES %s)
+                SELECT request.position, album.ROWID, album.name, artist.name FROM request
+                JOIN album ON album.search_name = request.album_search_name
+                JOIN artist ON artist.ROWID = album.artist_id
+                WHERE request.artist_search_name IS NULL OR artist.search_name = request.artist_search_name
+                ORDER BY request.position, album.ROWID
+            ''' % ", ".join(values), parameters)
+
+            for position, album_id, name, artist_name in rows:
+                if albums[position] is None:
+                    albums[position] = (album_id, name, artist_name)
+
+        # Misheard names go through the usual fuzzy chain one at a time
+        for position, (album_name, artist_name) in enumerate(requests):
+            if albums[position] is not None or album_name is None:
+                continue
+
+            album_id = self.get_album_id_by_album_artist(album_name, artist_name, False, False)
+            if album_id is not None:
+                albums[position] = self.fetch_one(
+                    "SELECT album.ROWID, album.name, artist.name FROM album JOIN artist ON artist.ROWID = album.artist_id WHERE album.ROWID = ?",
+                    (album_id,))
+
+        songs = self.get_album_songs(set(album[0] for album in albums if album is not None))
+
+        return [album + (songs.get(album[0], []),) if album is not None else None for album in albums]
+
+    def get_album_songs(self, album_ids):
+        album_ids = list(album_ids)
+        songs = {}
+
+        for start in range(0, len(album_ids), self.PARAMETER_BATCH_SIZE):
+            batch = album_ids[start:start + self.PARAMETER_BATCH_SIZE]
+            rows = self.fetch_each('''
+                SELECT album_id, ROWID, coalesce(disc_number, 0), coalesce(track_number, 0)
+                FROM song WHERE album_id IN (%s) ORDER BY album_id, disc_number, track_number, ROWID
+            ''' % ", ".join("?" * len(batch)), batch)
+
+            for album_id, song_id, disc, track in rows:
+                songs.setdefault(album_id, []).append((song_id, disc, track))
+
+        return songs
+
     def get_all_albums_by_artist(self, artist_name, fuzzy = False):
+        return self.cached(('albums_by_artist', grammar.strip_articles(artist_name), fuzzy), self.find_all_albums_by_artist, artist_name, fuzzy)
+
+    def find_all_albums_by_artist(self, artist_name, fuzzy = False):
         search_artist_name = grammar.strip_articles(artist_name)
 
-        if not fuzzy:
-            operator = "="
+        print("searching db...", file=sys.stderr)
+
+        if fuzzy and self.full_text_search:
+            results = self.fetch_all(
+                "SELECT album.name FROM artist_fts INNER JOIN album ON album.artist_id = artist_fts.rowid WHERE artist_fts MATCH ? ORDER BY bm25(artist_fts)",
+                (self.match_expression(search_artist_name),))
         else:
-            operator = "like"
-            search_artist_name = "%" + search_artist_name + "%"
+            if not fuzzy:
+                operator = "="
+            else:
+                operator = "like"
+                search_artist_name = "%" + search_artist_name + "%"
+
+            results = self.fetch_all(
+                "SELECT album.name FROM album INNER JOIN artist ON album.artist_id = artist.ROWID WHERE artist.search_name %s ?" % operator,
+                (search_artist_name,))
 
-        print("searching db...", file=sys.stderr)
-        cursor = self.get_connection().execute(
-            "SELECT album.name FROM album INNER JOIN artist ON album.artist_id = artist.ROWID WHERE artist.search_name %s ?" % operator,
-            (search_artist_name,))
-        results = cursor.fetchall()
         print("done with search!", file=sys.stderr)
 
         if len(results) == 0 and fuzzy == False:
-            return self.get_all_albums_by_artist(artist_name, True)
+            matches = self.match_artists(artist_name)
+            if len(matches) > 0:
+                results = self.fetch_all("SELECT name FROM album WHERE artist_id = ?", (matches[0][0],))
+
+        if len(results) == 0 and fuzzy == False:
+            return self.find_all_albums_by_artist(artist_name, True)
 
         if len(results) == 0:
             return None
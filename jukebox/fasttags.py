@@ -0,0 +1,231 @@
+import struct
+from .mp3 import MP3Object
+from .mp4 import MP4Object
+
+
+class FastTagError(Exception):
+    pass
+
+
+class TagFile:
+    # Most tags fit in the first block; anything further in is read with a seek, so cover art is never loaded
+    BLOCK_SIZE=65536
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.block = fileobj.read(self.BLOCK_SIZE)
+
+    def read(self, offset, size):
+        if offset + size <= len(self.block):
+            return self.block[offset:offset + size]
+
+        self.fileobj.seek(offset)
+        data = self.fileobj.read(size)
+        if len(data) < size:
+            raise FastTagError("Unexpected end of file")
+
+        return data
+
+    def size(self):
+        self.fileobj.seek(0, 2)
+        return self.fileobj.tell()
+
+
+class FastMP3Object(MP3Object):
+    FRAMES = ('TIT2', 'TPOS', 'TRCK', 'TALB', 'TPE1', 'TPE2')
+
+    TEXT_ENCODINGS = {0: ('latin-1', b'\x00'), 1: ('utf-16', b'\x00\x00'), 2: ('utf-16-be', b'\x00\x00'), 3: ('utf-8', b'\x00')}
+
+    # Frame flags that change how the payload is stored, for ID3v2.3 and ID3v2.4
+    UNSUPPORTED_FRAME_FLAGS = {3: 0x00C0, 4: 0x000F}
+
+    def __init__(self, path):
+        try:
+            with open(str(path), 'rb') as fileobj:
+                data = self.read_frames(TagFile(fileobj))
+        except (FastTagError, UnicodeDecodeError, struct.error):
+            return super().__init__(path)
+
+        self.title = str(self.get_title_tag(data))
+        self.disc_number = str(self.get_disc_number_tag(data))
+        self.track_number = str(self.get_track_number_tag(data))
+        self.album_name = str(self.get_album_tag(data))
+        self.artist_name = str(self.get_artist_tag(data))
+
+    def read_frames(self, tag_file):
+        header = tag_file.read(0, 10)
+        if header[:3] != b'ID3':
+            raise FastTagError("No ID3v2 header")
+
+        version, flags = header[3], header[5]
+        if version not in (3, 4) or flags & 0x80:
+            raise FastTagError("Unsupported ID3v2 version or unsynchronised tag")
+
+        end = 10 + self.syncsafe(header[6:10])
+        offset = 10
+
+        if flags & 0x40:
+            extended_size = tag_file.read(offset, 4)
+            offset += self.syncsafe(extended_size) if version == 4 else 4 + struct.unpack('>I', extended_size)[0]
+
+        frames = {}
+
+        while offset + 10 <= end:
+            frame_header = tag_file.read(offset, 10)
+            frame_id = frame_header[:4]
+
+            if frame_id[:1] == b'\x00':
+                break
+
+            if not frame_id.isalnum():
+                raise FastTagError("Invalid frame id")
+
+            size = self.syncsafe(frame_header[4:8]) if version == 4 else struct.unpack('>I', frame_header[4:8])[0]
+            frame_flags = struct.unpack('>H', frame_header[8:10])[0]
+            frame_id = frame_id.decode('ascii')
+            offset += 10
+
+            if offset + size > end:
+                raise FastTagError("Frame overruns tag")
+
+            if frame_id in self.FRAMES:
+                if frame_id in frames:
+                    raise FastTagError("Duplicate frame")
+
+                if frame_flags & self.UNSUPPORTED_FRAME_FLAGS[version]:
+                    raise FastTagError("Compressed, encrypted or unsynchronised frame")
+
+                frames[frame_id] = self.decode_text(tag_file.read(offset, size))
+
+            offset += size
+
+        # mutagen fills frames missing from the ID3v2 tag from an ID3v1 tag, so leave that case to it
+        if 'TIT2' not in frames or 'TALB' not in frames or 'TRCK' not in frames or ('TPE1' not in frames and 'TPE2' not in frames):
+            if tag_file.size() >= 128 and tag_file.read(tag_file.size() - 128, 3) == b'TAG':
+                raise FastTagError("ID3v1 tag present")
+
+        return frames
+
+    def decode_text(self, payload):
+        if len(payload) < 2 or payload[0] not in self.TEXT_ENCODINGS:
+            raise FastTagError("Unsupported text frame")
+
+        encoding, terminator = self.TEXT_ENCODINGS[payload[0]]
+        data = payload[1:]
+
+        if encoding.startswith('utf-16') and len(data) % 2:
+            data = data[:-1]
+
+        # One trailing terminator ends the last value; anything before it separates values
+        if data.endswith(terminator):
+            data = data[:-len(terminator)]
+
+        text = data.decode(encoding)
+        if '\ufeff' in text or '\ufffe' in text:
+            raise FastTagError("Multiple byte order marks")
+
+        return text
+
+    @staticmethod
+    def syncsafe(data):
+        if any(byte & 0x80 for byte in data):
+            raise FastTagError("Invalid syncsafe integer")
+
+        return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+class FastMP4Object(MP4Object):
+    ITEMS = (b'\xa9nam', b'\xa9alb', b'\xa9ART', b'\xa9wrt', b'disk', b'trkn')
+
+    # The atom path to the iTunes metadata list, and how many bytes of version/flags each container starts with
+    ILST_PATH = ((b'moov', 0), (b'udta', 0), (b'meta', 4), (b'ilst', 0))
+
+    TEXT_TYPE = 1
+    INTEGER_TYPE = 0
+
+    def __init__(self, path):
+        try:
+            with open(str(path), 'rb') as fileobj:
+                data = self.read_items(TagFile(fileobj))
+        except (FastTagError, UnicodeDecodeError, struct.error):
+            return super().__init__(path)
+
+        self.title = str(self.get_title_tag(data))
+        self.disc_number = str(self.get_disc_number_tag(data))
+        self.track_number = str(self.get_track_number_tag(data))
+        self.album_name = str(self.get_album_tag(data))
+        self.artist_name = str(self.get_artist_tag(data))
+
+    def read_items(self, tag_file):
+        start, end = 0, tag_file.size()
+
+        for name, skip in self.ILST_PATH:
+            atom = self.find_atom(tag_file, start, end, name)
+            if atom is None:
+                raise FastTagError("No %s atom" % name.decode('latin-1'))
+
+            start, end = atom[0] + skip, atom[1]
+
+            if name == b'meta' and tag_file.read(atom[0], 4) != b'\x00\x00\x00\x00':
+                raise FastTagError("Unsupported meta atom")
+
+        items = {}
+
+        for item_start, item_end, name in self.atoms(tag_file, start, end):
+            if name not in self.ITEMS or name.decode('latin-1') in items:
+                continue
+
+            value = self.read_data(tag_file, item_start, item_end, name)
+            if value is not None:
+                items[name.decode('latin-1')] = [value]
+
+        return items
+
+    def read_data(self, tag_file, start, end, name):
+        data = self.find_atom(tag_file, start, end, b'data')
+        if data is None:
+            raise FastTagError("Item without data")
+
+        payload = tag_file.read(data[0], data[1] - data[0])
+        if len(payload) < 8:
+            raise FastTagError("Short data atom")
+
+        data_type = struct.unpack('>I', payload[:4])[0] & 0xFFFFFF
+        value = payload[8:]
+
+        if name in (b'disk', b'trkn'):
+            if data_type != self.INTEGER_TYPE or len(value) < 6:
+                raise FastTagError("Unsupported number item")
+
+            return struct.unpack('>HH', value[2:6])
+
+        if data_type != self.TEXT_TYPE:
+            raise FastTagError("Unsupported text item")
+
+        return value.decode('utf-8')
+
+    def find_atom(self, tag_file, start, end, name):
+        for atom_start, atom_end, atom_name in self.atoms(tag_file, start, end):
+            if atom_name == name:
+                return atom_start, atom_end
+
+        return None
+
+    def atoms(self, tag_file, start, end):
+        offset = start
+
+        while offset + 8 <= end:
+            size, name = struct.unpack('>I4s', tag_file.read(offset, 8))
+            header_size = 8
+
+            if size == 1:
+                size = struct.unpack('>Q', tag_file.read(offset + 8, 8))[0]
+                header_size = 16
+            elif size == 0:
+                size = end - offset
+
+            if size < header_size or offset + size > end:
+                raise FastTagError("Invalid atom size")
+
+            yield offset + header_size, offset + size, name
+            offset += size
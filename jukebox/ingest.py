@@ -0,0 +1,363 @@
+import sys
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import namedtuple
+from queue import Queue, Empty, Full
+from .walker import LibraryWalker
+from .mp3 import MP3Object
+from .mp4 import MP4Object
+from .fasttags import FastMP3Object, FastMP4Object
+from .song import Song
+
+# A file without usable tags, whose fingerprint is recorded so it is not parsed again until it changes
+UnusableFile = namedtuple('UnusableFile', ['path', 'last_modified', 'file_size'])
+
+
+def read_song_records(items, engine):
+    # Files that could not be read come back as their bare path, so the pipeline can account for them
+    # and try them again on the next scan
+    records = []
+
+    for path, last_modified, file_size in items:
+        try:
+            song = IngestPipeline.read_tags(path, engine)
+        except OSError as error:
+            print("\nERROR reading %s: %s" % (path, error), file=sys.stderr)
+            records.append(path)
+            continue
+        except Exception as error:
+            print("\nERROR reading %s: %s" % (path, error), file=sys.stderr)
+            song = None
+
+        if song is None:
+            records.append(UnusableFile(path, last_modified, file_size))
+            continue
+
+        song.path = path
+        song.last_modified = last_modified
+        song.file_size = file_size
+
+        record = song.to_record()
+        records.append(record if record is not None else UnusableFile(path, last_modified, file_size))
+
+    return records
+
+
+class IngestPipeline:
+    THREAD_MODE='thread'
+    PROCESS_MODE='process'
+
+    MUTAGEN_ENGINE='mutagen'
+    # Reads only the ID3v2 frames / ilst atoms we store, and falls back to mutagen for anything unusual
+    FAST_ENGINE='fast'
+
+    ENGINES = {
+        MUTAGEN_ENGINE: (MP3Object, MP4Object),
+        FAST_ENGINE: (FastMP3Object, FastMP4Object),
+    }
+
+    READER_COUNT=8
+    QUEUE_SIZE=1000
+    BATCH_SIZE=1000
+    QUEUE_TIMEOUT=0.5
+
+    # Paths sent to a worker process per task, and tasks in flight per process
+    PROCESS_CHUNK_SIZE=64
+    PROCESS_TASKS_PER_WORKER=2
+    # Forking while the walker, watcher or other threads hold locks (stderr's, for one) can deadlock the children
+    PROCESS_START_METHOD='forkserver'
+
+    MP3_EXTENSIONS=('.mp3', '.aac')
+    MP4_EXTENSIONS=('.m4a', '.m4b', '.m4p', '.mp4')
+
+    # Marks the end of a stage's output on the queue it feeds
+    DONE = None
+
+    def __init__(self, database, reader_count=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, mode=THREAD_MODE,
+                 exclude=None, engine=MUTAGEN_ENGINE):
+        if mode not in (self.THREAD_MODE, self.PROCESS_MODE):
+            raise ValueError("Unknown extraction mode %s" % mode)
+
+        if engine not in self.ENGINES:
+            raise ValueError("Unknown tag engine %s" % engine)
+
+        if reader_count is None:
+            reader_count = (os.cpu_count() or 1) if mode == self.PROCESS_MODE else self.READER_COUNT
+
+        self.database = database
+        self.mode = mode
+        self.reader_count = max(1, int(reader_count))
+        self.consumer_count = self.reader_count if mode == self.THREAD_MODE else 1
+        self.batch_size = max(1, int(batch_size))
+        self.exclude = exclude
+        self.engine = engine
+
+        self.path_queue = Queue(maxsize=queue_size)
+        self.song_queue = Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+
+        self.found_count = 0
+        self.fingerprints = {}
+        self.walker = None
+        # Set once the walker has been through the whole library; only then are leftover fingerprints missing songs
+        self.walked = False
+        # The first exception that stopped a stage, re-raised by run once every stage has wound down
+        self.error = None
+
+        # Checkpoint bookkeeping: songs dispatched but not yet written per directory, and fully listed directories
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.listed = set()
+
+    def run(self, library_path, fingerprints=None, completed_directories=None):
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        self.walker = LibraryWalker(library_path, self.MP3_EXTENSIONS + self.MP4_EXTENSIONS, self.exclude,
+                                    completed_directories, self.directory_listed)
+
+        threads = [threading.Thread(target=self.walk, daemon=True)]
+
+        if self.mode == self.PROCESS_MODE:
+            threads.append(threading.Thread(target=self.read_in_processes, daemon=True))
+        else:
+            threads.extend([threading.Thread(target=self.read, daemon=True) for _ in range(self.reader_count)])
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            self.write()
+        finally:
+            self.stopped.set()
+
+            for thread in threads:
+                thread.join()
+
+        print("", file=sys.stderr)
+
+        # Songs the failed stage never got to would otherwise be reported as missing and deleted
+        if self.error is not None:
+            raise self.error
+
+        if not self.walked:
+            return {}
+
+        # A directory that could not be listed, e.g. on an unmounted share, would make all of its songs look deleted
+        if self.walker.errors > 0:
+            print("Skipping removal of missing songs: %s directories could not be read" % self.walker.errors, file=sys.stderr)
+            return {}
+
+        # Anything left over was not seen by the walker
+        return self.fingerprints
+
+    def walk(self):
+        try:
+            for path, stat in self.walker:
+                if self.stopped.is_set():
+                    return
+
+                # Files in directories checkpointed by an earlier run come through without a stat
+                if stat is None:
+                    self.fingerprints.pop(path, None)
+                    continue
+
+                # Unchanged files keep their fingerprint in the database and are never re-parsed
+                if self.fingerprints.pop(path, None) == (stat.st_mtime, stat.st_size):
+                    continue
+
+                self.found_count += 1
+                print("\rFound %s songs" % self.found_count, end='', file=sys.stderr)
+
+                directory = os.path.dirname(path)
+                with self.lock:
+                    self.pending[directory] = self.pending.get(directory, 0) + 1
+
+                self.put(self.path_queue, (path, stat))
+
+            self.walked = not self.stopped.is_set()
+        except Exception as error:
+            self.fail(error)
+        finally:
+            for _ in range(self.consumer_count):
+                self.put(self.path_queue, self.DONE)
+
+    def read(self):
+        try:
+            while True:
+                item = self.get(self.path_queue)
+                if item is self.DONE:
+                    return
+
+                path, stat = item
+
+                # Songs without usable tags are recorded by the database; files that failed to parse are recorded
+                # here, and files that could not be read at all are tried again on the next scan
+                try:
+                    song = self.read_song(path, stat, self.engine)
+                except OSError as error:
+                    print("\nERROR reading %s: %s" % (path, error), file=sys.stderr)
+                    song = path
+                except Exception as error:
+                    print("\nERROR reading %s: %s" % (path, error), file=sys.stderr)
+                    song = None
+
+                self.put(self.song_queue, song if song is not None else UnusableFile(path, stat.st_mtime, stat.st_size))
+        except Exception as error:
+            self.fail(error)
+        finally:
+            self.put(self.song_queue, self.DONE)
+
+    def read_in_processes(self):
+        max_pending = self.reader_count * self.PROCESS_TASKS_PER_WORKER
+        pending = set()
+        chunk = []
+        walking = True
+
+        try:
+            context = multiprocessing.get_context(self.PROCESS_START_METHOD)
+
+            with ProcessPoolExecutor(max_workers=self.reader_count, mp_context=context) as executor:
+                while walking or len(pending) > 0:
+                    if walking:
+                        item = self.get(self.path_queue)
+
+                        if item is self.DONE:
+                            walking = False
+                        else:
+                            path, stat = item
+                            chunk.append((path, stat.st_mtime, stat.st_size))
+
+                        if len(chunk) >= self.PROCESS_CHUNK_SIZE or (not walking and len(chunk) > 0):
+                            pending.add(executor.submit(read_song_records, chunk, self.engine))
+                            chunk = []
+
+                    # Keep the workers busy while capping how much parsed data is held in memory
+                    if len(pending) >= max_pending or (not walking and len(pending) > 0):
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                        for future in finished:
+                            for record in future.result():
+                                if isinstance(record, tuple) and not isinstance(record, UnusableFile):
+                                    record = Song.from_record(record)
+
+                                self.put(self.song_queue, record)
+
+                    if self.stopped.is_set():
+                        for future in pending:
+                            future.cancel()
+                        return
+        except Exception as error:
+            # e.g. BrokenProcessPool when a worker is killed or a parser crashes the interpreter
+            self.fail(error)
+        finally:
+            self.put(self.song_queue, self.DONE)
+
+    def write(self):
+        readers_running = self.consumer_count
+        songs = []
+        unusable = []
+        paths = []
+
+        while readers_running > 0:
+            # Returns DONE once a failed stage has stopped the pipeline, as its DONE may never be queued
+            item = self.get(self.song_queue)
+
+            if item is self.DONE:
+                readers_running -= 1
+                continue
+
+            # Unreadable files arrive as a bare path
+            if isinstance(item, str):
+                paths.append(item)
+                continue
+
+            if isinstance(item, UnusableFile):
+                unusable.append(item)
+            else:
+                songs.append(item)
+
+            paths.append(item.path)
+
+            if len(songs) + len(unusable) >= self.batch_size:
+                self.database.write_songs(songs, self.complete_directories(paths), unusable)
+                songs = []
+                unusable = []
+                paths = []
+
+        self.database.write_songs(songs, self.complete_directories(paths), unusable)
+
+    def fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+
+        self.stopped.set()
+
+    def directory_listed(self, directory):
+        with self.lock:
+            self.listed.add(directory)
+
+    def complete_directories(self, paths):
+        with self.lock:
+            for path in paths:
+                directory = os.path.dirname(path)
+                self.pending[directory] -= 1
+
+                if self.pending[directory] == 0:
+                    del self.pending[directory]
+
+            completed = [directory for directory in self.listed if directory not in self.pending]
+            self.listed.difference_update(completed)
+
+        return completed
+
+    def put(self, queue, item):
+        while not self.stopped.is_set():
+            try:
+                queue.put(item, timeout=self.QUEUE_TIMEOUT)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    def get(self, queue):
+        while not self.stopped.is_set():
+            try:
+                return queue.get(timeout=self.QUEUE_TIMEOUT)
+            except Empty:
+                continue
+
+        return self.DONE
+
+    @classmethod
+    def is_supported_path(cls, path):
+        return path.lower().endswith(cls.MP3_EXTENSIONS + cls.MP4_EXTENSIONS)
+
+    @classmethod
+    def read_tags(cls, path, engine=MUTAGEN_ENGINE):
+        extension = os.path.splitext(path)[1].lower()
+        mp3_class, mp4_class = cls.ENGINES[engine]
+
+        if extension in cls.MP3_EXTENSIONS:
+            return mp3_class(path)
+        elif extension in cls.MP4_EXTENSIONS:
+            return mp4_class(path)
+
+        return None
+
+    @classmethod
+    def read_song(cls, path, stat=None, engine=MUTAGEN_ENGINE):
+        song = cls.read_tags(path, engine)
+        if song is None:
+            return None
+
+        if stat is None:
+            stat = os.stat(path)
+
+        song.path = str(path)
+        song.last_modified = stat.st_mtime
+        song.file_size = stat.st_size
+
+        return song
@@ -14,10 +14,16 @@ def prepare_ssml(input_text):
 def nearly_finished():
     if playback.up_next:
         next_stream = playback.up_next
-        return autio().enqueue(next_stream)
+
+        if library.prefetcher is not None:
+            library.prefetcher.prefetch(next_stream)
+
+        return audio().enqueue(next_stream)
 
 @ask.on_playback_finished()
-def play_back_finished():
+def play_back_finished(token):
+    library.play_counts.finished(token)
+
     if playback.up_next:
         playback.step()
     else:
@@ -25,19 +31,19 @@ def play_back_finished():
 
 @ask.intent("JukeboxPlayAlbumByArtist")
 def play_album_by_artist(album_name, artist_name):
+    global playback
+
     if album_name is None:
         return
 
-    album_id = library.database.get_album_id_by_album_artist(album_name, artist_name, False, False)
+    bundle = library.get_catalog().get_album_bundle(album_name, artist_name)
  
-    if album_id is None:
+    if bundle is None or len(bundle[3]) == 0:
         return statement("I could not find that album in your library").simple_card("Find album %s", "Could not find any matching albums in your library")
 
-    real_artist_name = library.database.get_artist_name_by_album_id(album_id)
-    real_album_name = library.database.get_album_name_by_album_id(album_id)
-    songs = library.database.get_songs_by_album_id(album_id)
+    album_id, real_album_name, real_artist_name, songs = bundle
 
-    playback = Playback([base_url + '/songs/' + str(song) for song in songs])
+    playback = Playback([base_url + '/songs/' + str(song[0]) for song in songs])
     stream_url = playback.start()
 
     speech_text = "Playing the album %s by %s on your jukebox" % (real_album_name, real_artist_name)
@@ -63,6 +69,7 @@ def restart_track():
 
 @ask.on_playback_started()
 def started(offset, token, url):
+    library.play_counts.started(token, url or current_stream.url)
     print('Started autio stream for track {}'.format(playback.current_position))
 
 @ask.on_playback_stopped()
@@ -86,8 +93,9 @@ def list_albums_by_artist(artist_name):
     if artist_name is None:
         return
 
-    results = library.database.get_all_albums_by_artist(artist_name)
-    real_artist_name = library.database.get_artist_name(artist_name)
+    catalog = library.get_catalog()
+    results = catalog.get_all_albums_by_artist(artist_name)
+    real_artist_name = catalog.get_artist_name(artist_name)
 
     if real_artist_name is None:
         real_artist_name = artist_name
@@ -1,510 +1,125 @@
 import sys
 import os
 import threading
-import time
 from .database import Database
-from pathlib import Path
-from .mp3 import MP3Object
-from .mp4 import MP4Object
+from .catalog import Catalog
+from .ingest import IngestPipeline
+from .watcher import LibraryWatcher
+from .playcount import PlayCountTracker
+from .songfiles import SongFileCache
+from .prefetch import Prefetcher
+from .query import DataAdapter, DbAdapter, DbSelect
 from abc import ABC, abstractmethod
-import sqlite3
-import re
+from collections import namedtuple
 
 
 class Library:
-    SQL_BUFFER_SIZE=100000
-    MAX_THREAD_COUNT=100
-    THREAD_WAIT=0.25
-
-    def __init__(self, library_path):
+    def __init__(self, library_path, reader_count=None, queue_size=IngestPipeline.QUEUE_SIZE,
+                 batch_size=IngestPipeline.BATCH_SIZE, extract_mode=IngestPipeline.THREAD_MODE, exclude=None,
+                 tag_engine=IngestPipeline.MUTAGEN_ENGINE, connection_count=Database.READER_COUNT,
+                 busy_timeout=Database.BUSY_TIMEOUT, cache_size=Database.LOOKUP_CACHE_SIZE, cache_ttl=Database.LOOKUP_CACHE_TTL,
+                 song_file_cache_size=SongFileCache.SIZE, song_file_cache_ttl=SongFileCache.TTL):
         self.library_path = library_path
-        self.database = Database()
-        # TODO: Build library if the database was just created
-        # self.build_library()
-
-    def build_library(self):
-        song_count = 0
-
-        pathlist = Path(self.library_path).glob('**/*.*')
-
-        for path in pathlist:
-            song_count += 1
-            print("\rFound %s songs" % song_count, end='', file=sys.stderr)
-            sys.stderr.flush()
-
-            while threading.active_count() >= self.MAX_THREAD_COUNT:
-                time.sleep(self.THREAD_WAIT)
-
-            threading.Thread(target=self.prepare_song_worker, args=(str(path),)).start()
-
-            if self.database.song_queue.qsize() >= self.SQL_BUFFER_SIZE:
-                self.database.flush_song_queue()
-
-        self.database.flush_song_queue()
-
-        print("", file=sys.stderr)
-
-        return self
-
-    def prepare_song_worker(self, path):
-        if path.endswith(".mp3") or path.endswith(".aac"):
-            song = MP3Object(path)
-        elif path.endswith(".m4a") or path.endswith(".m4b") or path.endswith(".m4p") or path.endswith(".mp4"):
-            song = MP4Object(path)
-        else:
-            return None
-
-        song.path = str(path)
-        song.last_modified = os.path.getmtime(str(path))
-
-        self.database.song_queue.put(song)
-
-        return self
-
-
-class DataAdapter(ABC):
-    def __init__(self):
-        self.connection = None
-        self.connect()
-
-    def __del__(self):
-        self.close()
-
-    @abstractmethod
-    def connect(self):
-        raise NotImplementedError
-
-    @abstractmethod
-    def close(self):
-        raise NotImplementedError
-
-    @abstractmethod
-    def fetch_one(self, query):
-        raise NotImplementedError
-
-    @abstractmethod
-    def fetch_row(self, query):
-        pass
-
-    @abstractmethod
-    def fetch_all(self, query):
-        raise NotImplementedError
-
-    @abstractmethod
-    def execute(self, query):
-        raise NotImplementedError
-
-    @abstractmethod
-    def execute_many(self, query):
-        raise NotImplementedError
-
-    @staticmethod
-    @abstractmethod
-    def select():
-        raise NotImplementedError
-
-    @staticmethod
-    @abstractmethod
-    def quote_into(condition, value, value_type):
-        raise NotImplementedError
-
-
-class DbAdapter(DataAdapter):
-    INT_TYPE = 0
-    BIGINT_TYPE = 1
-    FLOAT_TYPE = 2
-
-    NUMERIC_DATA_TYPES = {
-        INT_TYPE: INT_TYPE,
-        BIGINT_TYPE: BIGINT_TYPE,
-        FLOAT_TYPE: FLOAT_TYPE,
-    }
-
-    BIGINT_PATTERN = re.compile(r'^([+-]?(?:0[Xx][\da-fA-F]+|\d+(?:[eE][+-]?\d+)?))')
-
-    def __init__(self, path):
-        self.path = path
-        super().__init__()
-
-    def connect(self):
-        self.connection = sqlite3.connect(self.path)
-
-    def close(self):
-        pass
-
-    def fetch_one(self, query):
-        pass
-
-    def fetch_row(self, query):
-        pass
-
-    def fetch_all(self, query):
-        pass
-
-    def execute(self, query):
-        pass
-
-    def execute_many(self, query):
-        pass
-
-    def validate_object(self, data_object):
-        pass
-
-    def query(self, sql, bind=[]):
-        pass
-
-    @staticmethod
-    def select():
-        return DbSelect()
-
-    @staticmethod
-    def quote(values, value_type=None):
-        if isinstance(values, list):
-            return ", ".join([DbAdapter.quote(value) for value in values])
-
-        if isinstance(values, DbSelect):
-            return "(" + values.assemble() + ")"
-
-        value = values
-
-        if value_type is not None:
-            value_type = value_type.upper()
-            if value_type == DbAdapter.INT_TYPE:
-                return int(value)
-            elif value_type == DbAdapter.BIGINT_TYPE:
-                matches = DbAdapter.BIGINT_PATTERN.search(value)
-                if matches is not None:
-                    return matches.group(1)
-            elif value_type == DbAdapter.FLOAT_TYPE:
-                return "{:10.4f}".format(values)
-
-            return 0
-
-        return DbAdapter.__quote(values)
-
-    @staticmethod
-    def __quote(value):
-        if isinstance(value, int):
-            return value
-        elif isinstance(value, float):
-            return "{:10.4f}".format(value)
-
-        return "'" + re.escape(value) + "'"
-
-    @staticmethod
-    def quote_into(text, value, value_type=None, count=None):
-        if count is None:
-            return text.replace('?', DbAdapter.quote(value, value_type))
-
-        while count > 0:
-            if text.find('?') >= 0:
-                text = text.replace('?', DbAdapter.quote(value, value_type), 1)
-
-            count -= 1
-
-        return text
-
-
-class DbSelect:
-    DISTINCT = 'distinct'
-    COLUMNS = 'columns'
-    FROM = 'from'
-    UNION = 'union'
-    WHERE = 'where'
-    GROUP = 'group'
-    HAVING = 'having'
-    ORDER = 'order'
-    LIMIT_COUNT = 'limit_count'
-    LIMIT_OFFSET = 'limit_offset'
-    FOR_UPDATE = 'for_update'
-
-    INNER_JOIN = 'inner join'
-    LEFT_JOIN = 'left join'
-    RIGHT_JOIN = 'right join'
-    FULL_JOIN = 'full join'
-    CROSS_JOIN = 'cross join'
-    NATURAL_JOIN = 'natural join'
-
-    SQL_WILDCARD = '*'
-    SQL_SELECT = 'SELECT'
-    SQL_UNION = 'UNION'
-    SQL_UNION_ALL = 'UNION ALL'
-    SQL_FROM = 'FROM'
-    SQL_WHERE = 'WHERE'
-    SQL_DISTINCT = 'DISTINCT'
-    SQL_GROUP_BY = 'GROUP BY'
-    SQL_ORDER_BY = 'ORDER BY'
-    SQL_HAVING = 'HAVING'
-    SQL_FOR_UPDATE = 'FOR UPDATE'
-    SQL_AND = 'AND'
-    SQL_AS = 'AS'
-    SQL_OR = 'OR'
-    SQL_ON = 'ON'
-    SQL_ASC = 'ASC'
-    SQL_DESC = 'DESC'
-
-    JOIN_TYPES = [INNER_JOIN, LEFT_JOIN, RIGHT_JOIN, FULL_JOIN, CROSS_JOIN, NATURAL_JOIN]
-    UNION_TYPES = [SQL_UNION, SQL_UNION_ALL]
-
-    ORDER_PATTERN = re.compile(r'(.*\W)(' + SQL_ASC + '|' + SQL_DESC + ')\b', re.IGNORECASE + re.DOTALL)
-
-    PARTS_INIT = {
-        DISTINCT: False,
-        COLUMNS: {},
-        FROM: [],
-        UNION: [],
-        WHERE: [],
-        GROUP: [],
-        HAVING: [],
-        ORDER: [],
-        LIMIT_COUNT: None,
-        LIMIT_OFFSET: None,
-        FOR_UPDATE: False,
-    }
-
-    def __init__(self, adapter):
-        self.__adapter = adapter
-        self.__parts = self.PARTS_INIT
-        self.__bind = []
-
-    def reset(self, part=None):
-        if part is None:
-            self.__parts = self.PARTS_INIT
+        self.exclude = exclude
+        self.tag_engine = tag_engine
+        self.extract_mode = extract_mode
+        self.reader_count = reader_count
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.database = Database(connection_count, busy_timeout, cache_size, cache_ttl)
+        self.song_files = SongFileCache(self.database, song_file_cache_size, song_file_cache_ttl)
+        self.watcher = None
+        self.play_counts = None
+        self.prefetcher = None
+        self.catalog_lock = threading.Lock()
+        self.load_catalog()
+        # A new database is filled by watch(), whose catch-up scan builds the whole library on first start
+
+    def build_library(self, incremental=False, bulk=None, resume=False):
+        if not os.path.isdir(self.library_path):
+            print("Library path %s is not available" % self.library_path, file=sys.stderr)
             return self
 
-        if part in self.__parts:
-            self.__parts[part] = self.PARTS_INIT[part]
-
-        return self
+        # A first build into an empty database can defer indexes and commit rarely
+        if bulk is None:
+            bulk = self.database.is_empty()
 
-    def get_bind(self):
-        return self.__bind
-
-    def bind(self, bind):
-        self.__bind = bind
-        return self
-
-    def distinct(self, flag=True):
-        self.__parts[self.DISTINCT] = flag
-        return self
-
-    def columns(self, columns, table_name=None):
-        if table_name is None:
-            table_name = self.FROM
-
-        return self.__table_cols(table_name, columns)
-
-    def select_from(self, table_name, columns=SQL_WILDCARD, schema=None):
-        return self.__join(self.FROM, table_name, None, columns, schema)
-
-    def union(self, data_queries, union_type=SQL_UNION):
-        if isinstance(data_queries, list) or isinstance(data_queries, tuple):
-            for data_query in data_queries:
-                item = [data_query, union_type]
-                self.__parts[self.UNION].append(item)
-
-    def join(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        return self.join_inner(table_name, condition, columns, schema)
-
-    def join_inner(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        return self.__join(self.INNER_JOIN, table_name, condition, columns, schema)
-
-    def join_left(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        return self.__join(self.LEFT_JOIN, table_name, condition, columns, schema)
-
-    def join_right(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        return self.__join(self.RIGHT_JOIN, table_name, condition, columns, schema)
-
-    def join_full(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        return self.__join(self.FULL_JOIN, table_name, condition, columns, schema)
-
-    def join_cross(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        return self.__join(self.CROSS_JOIN, table_name, condition, columns, schema)
-
-    def join_natural(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        return self.__join(self.NATURAL_JOIN, table_name, condition, columns, schema)
-
-    def where(self, condition, value=None, value_type=None):
-        self.__parts[self.WHERE].append(self.__where(condition, value, value_type, True))
-        return self
-
-    def or_where(self, condition, value=None, value_type=None):
-        self.__parts[self.WHERE].append(self.__where(condition, value, value_type, False))
-        return self
+        fingerprints = self.database.get_song_fingerprints() if incremental else {}
 
-    and_where = where
-
-    def group(self, columns):
-        if isinstance(columns, str):
-            columns = [columns]
-
-        self.__parts[self.GROUP].extend(columns)
-
-        return self
-
-    def having(self, condition, value=None, value_type=None, boolean_type=SQL_AND):
-        if value is not None:
-            condition = self.__adapter.quote_into(condition, value, value_type)
-
-        if len(self.__parts[self.HAVING]) > 1:
-            self.__parts[self.HAVING].append('%s (%s)' % (self.SQL_AND, condition))
+        # Directories finished by an interrupted run are only listed, not re-read
+        if resume:
+            completed_directories = self.database.get_scan_checkpoints()
+            print("Resuming scan, skipping %s finished directories" % len(completed_directories), file=sys.stderr)
         else:
-            self.__parts[self.HAVING].append(condition)
-
-        return self
-
-    def or_having(self, condition, value=None, value_type=None):
-        return self.having(condition, value, value_type, self.SQL_OR)
-
-    def order(self, columns):
-        if isinstance(columns, str):
-            columns = [columns]
+            completed_directories = set()
+            self.database.clear_scan_checkpoints()
 
-        for column in columns:
-            if column is None:
-                continue
+        pipeline = IngestPipeline(self.database, self.reader_count, self.queue_size, self.batch_size, self.extract_mode,
+                                  self.exclude, self.tag_engine)
 
-            direction = self.SQL_ASC
-            matches = self.ORDER_PATTERN.search(column)
-            if matches is not None:
-                column = matches.group(1).strip()
-                direction = matches.group(2)
+        if bulk:
+            self.database.begin_bulk_load()
 
-            self.__parts[self.ORDER].append([column, direction])
+        try:
+            missing = pipeline.run(self.library_path, fingerprints, completed_directories)
+        finally:
+            if bulk:
+                self.database.end_bulk_load()
 
-        return self
+        if len(missing) > 0:
+            print("Removing %s missing songs" % len(missing), file=sys.stderr)
+            self.database.delete_songs_by_path(missing.keys())
 
-    def limit(self, count=None, offset=None):
-        self.__parts[self.LIMIT_COUNT] = int(count)
-        self.__parts[self.LIMIT_OFFSET] = int(offset)
-        return self
-
-    def limit_page(self, page, row_count):
-        page = page if page > 0 else 1
-        row_count = row_count if row_count > 0 else 1
-        self.__parts[self.LIMIT_COUNT] = int(row_count)
-        self.__parts[self.LIMIT_OFFSET] = int(row_count * (page - 1))
-        return self
+        self.database.clear_scan_checkpoints()
 
-    def for_update(self, flag=True):
-        self.__parts[self.FOR_UPDATE]=flag
         return self
 
-    def get_part(self, part):
-        part = part.lower()
-        if part in self.__parts:
-            return self.__parts[part]
-
-        raise ValueError
-
-    def query(self, fetch_mode=None, bind=[]):
-        if len(bind) > 0:
-            self.bind(bind)
-
-        statement = self.__adapter.query(self)
-        if fetch_mode is None:
-            fetch_mode = self.__adapter.fetch_mode
-
-        statement.fetch_mode = fetch_mode
-        return statement
+    def load_catalog(self):
+        self.catalog = Catalog.load(self.database)
+        return self.catalog
 
-    def assemble(self):
-        sql = self.SQL_SELECT
+    def get_catalog(self):
+        # A stale snapshot keeps answering while a fresh one loads in the background
+        if self.catalog.is_stale() and self.catalog_lock.acquire(blocking=False):
+            threading.Thread(target=self.reload_catalog, daemon=True).start()
 
-        for part in self.__parts:
-            sql = getattr(self, '__render_' + part.lower().replace(' ', '_'))(sql)
+        return self.catalog
 
-        return sql
+    def reload_catalog(self):
+        try:
+            self.load_catalog()
+        finally:
+            self.catalog_lock.release()
 
-    def __join(self, join_type, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        # TODO
-        pass
+    def get_collection(self, data_object_class, chunk_size=None):
+        return DataObjectCollection(self.database.adapter, data_object_class, chunk_size)
 
-    def __join_using(self, join_type, table_name, condition, columns=SQL_WILDCARD, schema=None):
-        # TODO
-        pass
+    def track_plays(self, flush_interval=PlayCountTracker.FLUSH_INTERVAL):
+        if self.play_counts is None:
+            self.play_counts = PlayCountTracker(self.database, flush_interval).start()
 
-    def __unique_correlation(self, name):
-        # TODO
-        pass
+        return self.play_counts
 
-    def __table_cols(self, table_name, columns):
-        if isinstance(columns, dict):
-            for alias, column in columns:
-                self.__table_cols(table_name, ' AS '.join([alias, column]))
+    def prefetch_songs(self, prefetch_bytes=Prefetcher.PREFETCH_BYTES):
+        if self.prefetcher is None:
+            self.prefetcher = Prefetcher(self.song_files, prefetch_bytes).start()
 
-            return self
+        return self.prefetcher
 
-        if isinstance(columns, list) or isinstance(columns, tuple):
-            for column in columns:
-                if isinstance(column, list) and len(column) == 2:
-                    return self.__table_cols(table_name, {column[0]: column[1]})
+    def watch(self, mode=LibraryWatcher.AUTO_MODE, poll_interval=LibraryWatcher.POLL_INTERVAL,
+              full_poll_interval=LibraryWatcher.FULL_POLL_INTERVAL):
+        if self.watcher is None:
+            self.watcher = LibraryWatcher.create(self, mode, poll_interval, full_poll_interval).start()
 
-                return self.__table_cols(table_name, column)
+        return self.watcher
 
-        if isinstance(columns, str):
-            parts = re.split(r' as | ', columns, 0, re.IGNORECASE)
-            if len(parts) == 1:
-                self.__parts[self.COLUMNS][table_name].append(parts)
-            elif len(parts) == 2:
-                self.__parts[self.COLUMNS][table_name].append({parts[0]: parts[1]})
-            else:
-                raise ValueError
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
 
         return self
 
-    def __where(self, condition, value=None, value_type=None, where_type=SQL_AND):
-        # TODO
-        pass
-
-    def __render_distinct(self, sql):
-        # TODO
-        pass
-
-    def __render_columns(self, sql):
-        # TODO
-        pass
-
-    def __render_from(self, sql):
-        # TODO
-        pass
-
-    def __render_union(self, sql):
-        # TODO
-        pass
-
-    def __render_where(self, sql):
-        # TODO
-        pass
-
-    def __render_group(self, sql):
-        # TODO
-        pass
-
-    def __render_having(self, sql):
-        # TODO
-        pass
-
-    def __render_order(self, sql):
-        # TODO
-        pass
-
-    def __render_limit_offset(self, sql):
-        # TODO
-        pass
-
-    def __render_for_update(self, sql):
-        # TODO
-        pass
-
-    def __call__(self, args):
-        # TODO
-        pass
-
-    def __str__(self):
-        # TODO
-        pass
-
 
 class DataObject(ABC):
     # ********************************************
@@ -547,33 +162,86 @@ class DataObject(ABC):
         pass
 
     def get_collection(self):
-        return DataObjectCollection(self.data_adapter)
+        return DataObjectCollection(self.data_adapter, type(self))
 
     def save(self):
         pass
 
 
 class DataObjectCollection(ABC):
-    def __init__(self, data_adapter=None):
+    # Rows pulled from the cursor at a time; iterating never holds more than this many in memory
+    CHUNK_SIZE=500
+
+    OPERATORS = ['=', '!=', '<', '<=', '>', '>=', 'LIKE', 'IN']
+
+    def __init__(self, data_adapter=None, data_object_class=None, chunk_size=None):
         self.data_adapter = data_adapter
-        self.data_query = data_adapter.get_data_query
+        self.data_object_class = data_object_class
+        self.chunk_size = max(1, int(chunk_size)) if chunk_size is not None else self.CHUNK_SIZE
 
-        self.current = 0
-        self.items = None
+        self.fields = []
+        self.field_filters = []
+        self.orders = []
+        self.page = None
 
         super().__init__()
 
+    # Streams rows as named tuples, one chunk at a time, and can be iterated again to run the query again
     def __iter__(self):
-        return self
+        fields = self.get_fields()
+        row_class = namedtuple(self.data_object_class.__name__ + 'Row', fields)
 
-    def next(self):
-        self.current += 1
-        try:
-            return self.items.index(self.current)
-        except ValueError:
-            raise StopIteration
+        for rows in self.data_adapter.fetch_chunks(self.get_select(fields), self.chunk_size):
+            for row in rows:
+                yield row_class._make(row)
+
+    def get_column(self, field):
+        definition = self.data_object_class.FIELDS.get(field)
+        if definition is None:
+            raise ValueError("Unknown field %s for %s" % (field, self.data_object_class.TABLE_NAME))
+
+        return "%s.%s" % (self.data_object_class.TABLE_NAME, definition.get('field_name', field))
+
+    def get_fields(self):
+        return self.fields if len(self.fields) > 0 else list(self.data_object_class.FIELDS)
+
+    def get_select(self, fields=None):
+        if fields is None:
+            fields = self.get_fields()
 
+        select = self.data_adapter.select().select_from(self.data_object_class.TABLE_NAME, [(self.get_column(field), field) for field in fields])
+        self.apply_filters(select)
+
+        for field, direction in self.orders:
+            select.order("%s %s" % (self.get_column(field), direction))
+
+        if self.page is not None:
+            select.limit_page(*self.page)
+
+        return select
+
+    def apply_filters(self, select):
+        for field, operator, value in self.field_filters:
+            placeholder = "(?)" if operator == 'IN' else "?"
+            select.where("%s %s %s" % (self.get_column(field), operator, placeholder), value)
+
+        return select
+
+    # Filters are (field, value), which matches lists with IN, or (field, operator, value)
     def add_field_filter(self, field_filter):
+        if len(field_filter) == 2:
+            field, value = field_filter
+            operator = 'IN' if isinstance(value, (list, tuple)) else '='
+        else:
+            field, operator, value = field_filter
+            operator = operator.upper()
+
+        if operator not in self.OPERATORS:
+            raise ValueError("Unsupported operator %s" % operator)
+
+        self.get_column(field)
+        self.field_filters.append((field, operator, value))
+
         return self
 
     def add_field_filters(self, field_filters):
@@ -583,6 +251,8 @@ class DataObjectCollection(ABC):
         return self
 
     def add_field(self, field):
+        self.get_column(field)
+        self.fields.append(field)
         return self
 
     def add_fields(self, fields):
@@ -591,14 +261,29 @@ class DataObjectCollection(ABC):
 
         return self
 
+    def order(self, field, direction=DbSelect.SQL_ASC):
+        self.get_column(field)
+        self.orders.append((field, DbSelect.SQL_DESC if direction.upper() == DbSelect.SQL_DESC else DbSelect.SQL_ASC))
+        return self
+
+    def limit_page(self, page, row_count):
+        self.page = (page, row_count)
+        return self
+
     def clear(self):
-        pass
+        self.fields = []
+        self.field_filters = []
+        self.orders = []
+        self.page = None
+        return self
 
     def count(self):
-        pass
+        select = self.data_adapter.select().select_from(self.data_object_class.TABLE_NAME, [('count(*)', 'count')])
+        return self.data_adapter.fetch_one(self.apply_filters(select))
 
+    # Materializes every row; prefer iterating for anything library-wide
     def get_items(self):
-        pass
+        return list(self)
 
 
 class Song(DataObject):
@@ -609,11 +294,13 @@ class Song(DataObject):
         'title': {'field_name': 'name', 'data_type': 'TEXT'},
         'search_title': {'field_name': 'search_name', 'data_type': 'TEXT'},
         'path': {'data_type': 'TEXT'},
-        'disc_number': {'data_type': 'TEXT'},
-        'track_number': {'data_type': 'TEXT'},
+        'disc_number': {'data_type': 'INTEGER'},
+        'track_number': {'data_type': 'INTEGER'},
         'play_count': {'data_type': 'INTEGER', 'default_value': 0},
         'artist_id': {'data_type': 'INTEGER'},
         'album_id': {'data_type': 'INTEGER'},
+        'file_size': {'data_type': 'INTEGER'},
+        'last_modified': {'data_type': 'REAL'},
     }
 
     PRIMARY_KEY = ['ROWID']
@@ -628,13 +315,7 @@ class Song(DataObject):
     }
 
     INDEXES = {
-        'idx_song_name_artist_id_album_id': ['name', 'artist_id', 'album_id'],
-        'idx_song_name_artist_id': ['name', 'artist_id'],
-        'idx_song_name_album_id': ['name', 'album_id'],
-        'idx_song_name': ['name'],
-        'idx_song_search_name': ['search_name'],
-        'idx_song_album_id': ['album_id'],
-        'idx_song_artist_id': ['artist_id'],
+        'idx_song_album_id_disc_number_track_number': ['album_id', 'disc_number', 'track_number'],
     }
 
     def __init__(self, data_adapter, song=None):
@@ -673,9 +354,8 @@ class Album(DataObject):
     }
 
     INDEXES = {
-        'idx_album_name': ['name'],
         'idx_album_search_name': ['search_name'],
-        'idx_album_artist_id': ['artist_id'],
+        'idx_album_artist_id_name': ['artist_id', 'name'],
     }
 
     def __init__(self, data_adapter, album=None):
@@ -0,0 +1,164 @@
+import threading
+import heapq
+import unicodedata
+from collections import Counter
+
+
+class NameMatcher:
+    # Only this many names sharing the most trigrams (plus any sharing the phonetic key) get the full scoring
+    CANDIDATE_LIMIT=50
+    MIN_SCORE=0.5
+
+    TRIGRAM_WEIGHT=0.45
+    PHONETIC_WEIGHT=0.2
+    EDIT_WEIGHT=0.35
+
+    # Soundex-style classes of letters that sound alike; vowels and h, w, y carry no code
+    PHONETIC_CODES = {letter: code for letters, code in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6'))
+                      for letter in letters}
+
+    def __init__(self, names=()):
+        self.lock = threading.Lock()
+        self.names = {}
+        self.phonetic_keys = {}
+        self.trigram_index = {}
+        self.phonetic_index = {}
+
+        for key, name in names:
+            self.add(key, name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, key, name):
+        compact = self.normalize(name)
+        phonetic_key = self.phonetic_key(compact)
+
+        with self.lock:
+            if key in self.names:
+                self._remove(key)
+
+            self.names[key] = compact
+            self.phonetic_keys[key] = phonetic_key
+
+            for trigram in self.trigrams(compact):
+                self.trigram_index.setdefault(trigram, set()).add(key)
+
+            self.phonetic_index.setdefault(phonetic_key, set()).add(key)
+
+        return self
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.names:
+                self._remove(key)
+
+        return self
+
+    def _remove(self, key):
+        compact = self.names.pop(key)
+        phonetic_key = self.phonetic_keys.pop(key)
+
+        for trigram in self.trigrams(compact):
+            keys = self.trigram_index[trigram]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self.trigram_index[trigram]
+
+        keys = self.phonetic_index[phonetic_key]
+        keys.discard(key)
+        if len(keys) == 0:
+            del self.phonetic_index[phonetic_key]
+
+    def match(self, name, limit=5):
+        compact = self.normalize(name)
+        if compact == '':
+            return []
+
+        query_trigrams = self.trigrams(compact)
+        phonetic_key = self.phonetic_key(compact)
+
+        with self.lock:
+            shared = Counter()
+            for trigram in query_trigrams:
+                shared.update(self.trigram_index.get(trigram, ()))
+
+            candidates = set(key for key, _ in heapq.nlargest(self.CANDIDATE_LIMIT, shared.items(), key=lambda item: item[1]))
+            candidates.update(self.phonetic_index.get(phonetic_key, ()))
+
+            entries = [(key, self.names[key], self.phonetic_keys[key], shared.get(key, 0)) for key in candidates]
+
+        results = []
+
+        for key, candidate, candidate_phonetic_key, shared_count in entries:
+            trigram_score = 2.0 * shared_count / (len(query_trigrams) + len(self.trigrams(candidate)))
+            phonetic_score = self.similarity(phonetic_key, candidate_phonetic_key)
+            edit_score = self.similarity(compact, candidate)
+
+            score = self.TRIGRAM_WEIGHT * trigram_score + self.PHONETIC_WEIGHT * phonetic_score + self.EDIT_WEIGHT * edit_score
+            if score >= self.MIN_SCORE:
+                results.append((key, score))
+
+        results.sort(key=lambda result: result[1], reverse=True)
+
+        return results[:limit]
+
+    @staticmethod
+    def normalize(name):
+        # Misheard names differ in spacing, accents and punctuation ("radio head", "sigur ros"), so none of them count
+        decomposed = unicodedata.normalize('NFKD', name.lower())
+        return ''.join(character for character in decomposed if character.isalnum())
+
+    @staticmethod
+    def trigrams(compact):
+        padded = '  ' + compact + ' '
+        return set(padded[index:index + 3] for index in range(len(padded) - 2))
+
+    @classmethod
+    def phonetic_key(cls, compact):
+        if compact == '':
+            return ''
+
+        key = compact[0]
+        previous = cls.PHONETIC_CODES.get(compact[0], compact[0])
+
+        for character in compact[1:]:
+            if character.isdigit():
+                code = character
+            elif character in 'hwy':
+                continue
+            else:
+                code = cls.PHONETIC_CODES.get(character, '')
+
+            if code != '' and code != previous:
+                key += code
+
+            previous = code
+
+        return key
+
+    @classmethod
+    def similarity(cls, first, second):
+        longest = max(len(first), len(second))
+        if longest == 0:
+            return 1.0
+
+        return 1.0 - cls.edit_distance(first, second) / longest
+
+    @staticmethod
+    def edit_distance(first, second):
+        if len(first) < len(second):
+            first, second = second, first
+
+        previous = list(range(len(second) + 1))
+
+        for row, first_character in enumerate(first, 1):
+            current = [row]
+
+            for column, second_character in enumerate(second, 1):
+                current.append(min(previous[column] + 1, current[column - 1] + 1,
+                                   previous[column - 1] + (first_character != second_character)))
+
+            previous = current
+
+        return previous[-1]
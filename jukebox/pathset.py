@@ -0,0 +1,92 @@
+import bisect
+from array import array
+from hashlib import blake2b
+
+
+class PathSet:
+    # Above this many paths, paths are stored as sorted 64-bit digests (8 bytes each) instead of strings
+    HASHED_THRESHOLD=250000
+    # Pending additions and removals are folded into the sorted digests once there are this many
+    MERGE_THRESHOLD=10000
+
+    def __init__(self, paths=(), hashed=None):
+        if hashed is None:
+            paths = list(paths)
+            hashed = len(paths) > self.HASHED_THRESHOLD
+
+        self.hashed = hashed
+
+        if hashed:
+            self.digests = array('Q', sorted(set(self.digest(path) for path in paths)))
+            self.added = set()
+            self.removed = set()
+        else:
+            self.paths = set(paths)
+
+    def __contains__(self, path):
+        if not self.hashed:
+            return path in self.paths
+
+        return self.contains_digest(self.digest(path))
+
+    def __len__(self):
+        if not self.hashed:
+            return len(self.paths)
+
+        return len(self.digests) + len(self.added) - len(self.removed)
+
+    def add(self, path):
+        if not self.hashed:
+            self.paths.add(path)
+            return self
+
+        key = self.digest(path)
+        if key in self.removed:
+            self.removed.discard(key)
+        elif not self.contains_digest(key):
+            self.added.add(key)
+
+        return self.merge_if_needed()
+
+    def discard(self, path):
+        if not self.hashed:
+            self.paths.discard(path)
+            return self
+
+        key = self.digest(path)
+        if key in self.added:
+            self.added.discard(key)
+        elif self.contains_digest(key):
+            self.removed.add(key)
+
+        return self.merge_if_needed()
+
+    def contains_digest(self, key):
+        if key in self.added:
+            return True
+
+        if key in self.removed:
+            return False
+
+        index = bisect.bisect_left(self.digests, key)
+        return index < len(self.digests) and self.digests[index] == key
+
+    def merge_if_needed(self):
+        if len(self.added) + len(self.removed) < self.MERGE_THRESHOLD:
+            return self
+
+        digests = set(self.digests)
+        digests.difference_update(self.removed)
+        digests.update(self.added)
+
+        self.digests = array('Q', sorted(digests))
+        self.added = set()
+        self.removed = set()
+
+        return self
+
+    @staticmethod
+    def digest(path):
+        # surrogateescape keeps undecodable file names hashable
+        value = blake2b(path.encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+        return int.from_bytes(value, 'little')
@@ -6,6 +6,7 @@ import sys
 
 class Playback:
     def __init__(self, urls):
+        library.song_files.warm(urls)
         self._urls = urls
         self._queued = collections.deque(urls)
         self._history = collections.deque()
@@ -47,17 +48,27 @@ class Playback:
             return None
 
     def add(self, url):
+        library.song_files.warm([url])
         self._urls.append(url)
         self._queued.append(url)
+        self._prefetch_next()
 
     def extend(self, urls):
+        library.song_files.warm(urls)
         self._urls.extend(urls)
         self._queued.extend(urls)
+        self._prefetch_next()
 
     def _save_to_history(self):
         if self._current:
             self._history.append(self._current)
 
+    # Whenever the next song changes, its start is read ahead so the transition does not wait on the disk. Not on
+    # construction, since start() streams the first song right away and a read ahead would only compete with it
+    def _prefetch_next(self):
+        if library.prefetcher is not None and self.up_next:
+            library.prefetcher.prefetch(self.up_next)
+
     def end_current(self):
         self._save_to_history()
         self._current = None
@@ -68,16 +79,19 @@ class Playback:
 
         self.end_current()
         self._current = self._queued.popleft()
+        self._prefetch_next()
         return self._current
 
     def step_back(self):
         self._queued.appendleft(self._current)
         self._current = self._history.pop()
+        self._prefetch_next()
         return self._current
 
     def reset(self):
         self._queued = collections.deque(self._urls)
         self._history = []
+        self._prefetch_next()
 
     def start(self):
         self.__init__(self._urls)
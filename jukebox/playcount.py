@@ -0,0 +1,98 @@
+import sys
+import re
+import atexit
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+
+
+class PlayCountTracker:
+    # Seconds between batched writes of the plays counted in memory
+    FLUSH_INTERVAL=30.0
+    # Streams started but not yet finished; bounded since a finish event may never arrive
+    MAX_PLAYING=1000
+
+    SONG_URL_PATTERN = re.compile(r'/songs/(\d+)')
+
+    def __init__(self, database, flush_interval=FLUSH_INTERVAL):
+        self.database = database
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.playing = OrderedDict()
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+        return self.flush()
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    # Playback callbacks only touch memory; a play counts once its stream finishes, so skipped tracks do not
+    def started(self, token, url):
+        song_id = self.get_song_id(url)
+        if song_id is None:
+            return self
+
+        with self.lock:
+            self.playing[token] = song_id
+            self.playing.move_to_end(token)
+
+            while len(self.playing) > self.MAX_PLAYING:
+                self.playing.popitem(last=False)
+
+        return self
+
+    def finished(self, token):
+        with self.lock:
+            song_id = self.playing.pop(token, None)
+            if song_id is not None:
+                self.counts[song_id] += 1
+
+        return self
+
+    def record(self, song_id, plays=1):
+        with self.lock:
+            self.counts[int(song_id)] += plays
+
+        return self
+
+    def flush(self):
+        with self.lock:
+            counts = self.counts
+            self.counts = Counter()
+
+        if len(counts) == 0:
+            return self
+
+        try:
+            self.database.add_play_counts(counts)
+        except sqlite3.Error as error:
+            print("ERROR saving play counts, retrying later: %s" % error, file=sys.stderr)
+
+            with self.lock:
+                self.counts.update(counts)
+
+        return self
+
+    @classmethod
+    def get_song_id(cls, url):
+        matches = cls.SONG_URL_PATTERN.search(url or '')
+        return int(matches.group(1)) if matches is not None else None
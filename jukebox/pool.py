@@ -0,0 +1,79 @@
+import os
+import threading
+import sqlite3
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+from urllib.request import pathname2url
+
+
+class ConnectionPool:
+    # Prepared statements kept per connection, so the same lookups are not parsed and planned again
+    CACHED_STATEMENTS=256
+
+    def __init__(self, path, size, busy_timeout):
+        self.path = os.path.abspath(path)
+        self.size = max(1, int(size))
+        self.busy_timeout = busy_timeout
+
+        # Most recently returned connections are reused first, so their page caches stay warm
+        self.idle = LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+
+        if not create:
+            # Every connection is leased out, so wait for a thread to hand one back
+            return self.idle.get()
+
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+
+        self.idle.put(connection)
+
+    def connect(self):
+        # Read-only connections never take the write lock, and in WAL mode they read alongside the writer
+        uri = 'file:%s?mode=ro' % pathname2url(self.path)
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=self.busy_timeout / 1000,
+                                     cached_statements=self.CACHED_STATEMENTS)
+        connection.execute("PRAGMA busy_timeout = %d" % self.busy_timeout)
+
+        return connection
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                break
+
+        with self.lock:
+            self.created = 0
+
+        return self
@@ -0,0 +1,111 @@
+import sys
+import os
+import time
+import threading
+from queue import Queue, Full
+from .cache import LRUCache
+from .playcount import PlayCountTracker
+
+
+# Reads the start of the next queued song ahead of time, so a spun-down network share wakes up while the current
+# song is still playing and the next stream starts from the page cache
+class Prefetcher:
+    # Bytes read from the start of each song, enough for the player to buffer while the rest arrives
+    PREFETCH_BYTES=4194304
+    READ_SIZE=262144
+    QUEUE_SIZE=8
+
+    # Songs remembered as prefetched, so stepping back and forth through a queue does not read them again
+    RECENT_SIZE=64
+    RECENT_TTL=600.0
+
+    def __init__(self, song_files, prefetch_bytes=PREFETCH_BYTES):
+        self.song_files = song_files
+        self.prefetch_bytes = prefetch_bytes
+
+        self.queue = Queue(self.QUEUE_SIZE)
+        self.recent = LRUCache(self.RECENT_SIZE, self.RECENT_TTL)
+        # Only the worker thread reads into it, so one buffer serves every prefetch
+        self.buffer = bytearray(self.READ_SIZE)
+        self.thread = None
+
+        self.lock = threading.Lock()
+        self.first_bytes = {True: [0, 0.0, 0.0], False: [0, 0.0, 0.0]}
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+        return self
+
+    def run(self):
+        while True:
+            self.load(self.queue.get())
+
+    def prefetch(self, url):
+        song_id = PlayCountTracker.get_song_id(url)
+        if song_id is None or self.recent.get(song_id) is not LRUCache.MISSING:
+            return self
+
+        try:
+            self.queue.put_nowait(song_id)
+        except Full:
+            # The worker is stuck on a slow disk; songs further ahead can wait for their own turn
+            return self
+
+        self.recent.put(song_id, time.monotonic())
+        return self
+
+    def load(self, song_id):
+        started = time.perf_counter()
+
+        song_file = self.song_files.get(song_id)
+        if song_file is None:
+            return self
+
+        length = min(self.prefetch_bytes, song_file.size)
+        read = 0
+
+        try:
+            with open(song_file.path, 'rb', buffering=0) as file:
+                # Network filesystems may ignore the hint, so the bytes are read as well
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(file.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+
+                view = memoryview(self.buffer)
+                while read < length:
+                    count = file.readinto(view[:min(self.READ_SIZE, length - read)])
+                    if not count:
+                        break
+                    read += count
+        except OSError as error:
+            print("ERROR prefetching song %s: %s" % (song_id, error), file=sys.stderr)
+            return self
+
+        print("Prefetched %s bytes of song %s in %.1f ms" % (read, song_id, (time.perf_counter() - started) * 1000), file=sys.stderr)
+        return self
+
+    # Called by the stream endpoint with the time until a song's first bytes were read
+    def record_first_byte(self, song_id, seconds):
+        prefetched = self.recent.get(song_id) is not LRUCache.MISSING
+
+        with self.lock:
+            timing = self.first_bytes[prefetched]
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+        print("First byte of song %s after %.1f ms%s" % (song_id, seconds * 1000, " (prefetched)" if prefetched else ""), file=sys.stderr)
+        return self
+
+    def stats(self):
+        with self.lock:
+            return {
+                'prefetched' if prefetched else 'not_prefetched': {
+                    'streams': count,
+                    'mean_first_byte_ms': total / count * 1000 if count > 0 else 0.0,
+                    'max_first_byte_ms': longest * 1000,
+                }
+                for prefetched, (count, total, longest) in self.first_bytes.items()
+            }
@@ -0,0 +1,742 @@
+import threading
+import sqlite3
+import re
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from .pool import ConnectionPool
+
+
+class DataAdapter(ABC):
+    def __init__(self):
+        self.connection = None
+        self.connect()
+
+    def __del__(self):
+        self.close()
+
+    @abstractmethod
+    def connect(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def fetch_one(self, query, bind=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def fetch_row(self, query, bind=None):
+        pass
+
+    @abstractmethod
+    def fetch_all(self, query, bind=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def fetch_chunks(self, query, size, bind=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def execute(self, query, bind=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def execute_many(self, query, binds):
+        raise NotImplementedError
+
+    @abstractmethod
+    def select(self):
+        raise NotImplementedError
+
+    @staticmethod
+    @abstractmethod
+    def quote_into(condition, value, value_type):
+        raise NotImplementedError
+
+
+class DbAdapter(DataAdapter):
+    INT_TYPE = 0
+    BIGINT_TYPE = 1
+    FLOAT_TYPE = 2
+
+    NUMERIC_DATA_TYPES = {
+        INT_TYPE: INT_TYPE,
+        BIGINT_TYPE: BIGINT_TYPE,
+        FLOAT_TYPE: FLOAT_TYPE,
+    }
+
+    BIGINT_PATTERN = re.compile(r'^([+-]?(?:0[Xx][\da-fA-F]+|\d+(?:[eE][+-]?\d+)?))')
+
+    # The builder renders one SQL text per query shape, so a connection's prepared statements keep being reused
+    CACHED_STATEMENTS=ConnectionPool.CACHED_STATEMENTS
+
+    def __init__(self, path, pool=None):
+        self.path = path
+        # With a pool, every query leases one of its connections instead of using a connection of its own
+        self.pool = pool
+        super().__init__()
+
+    def connect(self):
+        if self.pool is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.CACHED_STATEMENTS)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @contextmanager
+    def get_connection(self):
+        if self.pool is None:
+            yield self.connection
+            return
+
+        with self.pool.connection() as connection:
+            yield connection
+
+    def fetch_one(self, query, bind=None):
+        row = self.fetch_row(query, bind)
+        return row[0] if row is not None else None
+
+    def fetch_row(self, query, bind=None):
+        sql, bind = self.render(query, bind)
+
+        with self.get_connection() as connection:
+            return connection.execute(sql, bind).fetchone()
+
+    def fetch_all(self, query, bind=None):
+        sql, bind = self.render(query, bind)
+
+        with self.get_connection() as connection:
+            return connection.execute(sql, bind).fetchall()
+
+    # Yields lists of at most size rows, holding the connection until the last one is read
+    def fetch_chunks(self, query, size, bind=None):
+        sql, bind = self.render(query, bind)
+
+        with self.get_connection() as connection:
+            cursor = connection.execute(sql, bind)
+
+            try:
+                rows = cursor.fetchmany(size)
+                while len(rows) > 0:
+                    yield rows
+                    rows = cursor.fetchmany(size)
+            finally:
+                cursor.close()
+
+    def execute(self, query, bind=None):
+        sql, bind = self.render(query, bind)
+
+        with self.get_connection() as connection:
+            cursor = connection.execute(sql, bind)
+            connection.commit()
+
+        return cursor.rowcount
+
+    def execute_many(self, query, binds):
+        sql, _ = self.render(query)
+
+        with self.get_connection() as connection:
+            cursor = connection.executemany(sql, binds)
+            connection.commit()
+
+        return cursor.rowcount
+
+    def validate_object(self, data_object):
+        pass
+
+    def query(self, sql, bind=[]):
+        sql, bind = self.render(sql, bind)
+
+        with self.get_connection() as connection:
+            for row in connection.execute(sql, bind):
+                yield row
+
+    @staticmethod
+    def render(query, bind=None):
+        if isinstance(query, DbSelect):
+            return query.assemble(), query.get_bind() + list(bind or [])
+
+        return query, list(bind or [])
+
+    def select(self):
+        return DbSelect(self)
+
+    @staticmethod
+    def cast(value, value_type=None):
+        if value_type is None or isinstance(value, DbSelect):
+            return value
+
+        if isinstance(value, (list, tuple)):
+            return [DbAdapter.cast(item, value_type) for item in value]
+
+        if value_type == DbAdapter.INT_TYPE:
+            return int(value)
+        elif value_type == DbAdapter.BIGINT_TYPE:
+            matches = DbAdapter.BIGINT_PATTERN.search(str(value))
+            if matches is None:
+                return 0
+
+            number = matches.group(1).lower()
+            if 'x' in number:
+                return int(number, 16)
+
+            return int(float(number)) if 'e' in number else int(number)
+        elif value_type == DbAdapter.FLOAT_TYPE:
+            return float(value)
+
+        return value
+
+    @staticmethod
+    def quote(values, value_type=None):
+        if isinstance(values, (list, tuple)):
+            return ", ".join([str(DbAdapter.quote(value, value_type)) for value in values])
+
+        if isinstance(values, DbSelect):
+            return "(" + values.assemble() + ")"
+
+        return DbAdapter.__quote(DbAdapter.cast(values, value_type))
+
+    @staticmethod
+    def __quote(value):
+        if value is None:
+            return 'NULL'
+        elif isinstance(value, int):
+            return str(value)
+        elif isinstance(value, float):
+            return repr(value)
+
+        return "'" + str(value).replace("'", "''") + "'"
+
+    # Only for building SQL by hand, e.g. in DDL; DbSelect binds its values as parameters instead
+    @staticmethod
+    def quote_into(text, value, value_type=None, count=None):
+        if count is None:
+            return text.replace('?', DbAdapter.quote(value, value_type))
+
+        while count > 0:
+            if text.find('?') >= 0:
+                text = text.replace('?', DbAdapter.quote(value, value_type), 1)
+
+            count -= 1
+
+        return text
+
+
+class DbSelect:
+    DISTINCT = 'distinct'
+    COLUMNS = 'columns'
+    FROM = 'from'
+    UNION = 'union'
+    WHERE = 'where'
+    GROUP = 'group'
+    HAVING = 'having'
+    ORDER = 'order'
+    LIMIT_COUNT = 'limit_count'
+    LIMIT_OFFSET = 'limit_offset'
+    FOR_UPDATE = 'for_update'
+
+    INNER_JOIN = 'inner join'
+    LEFT_JOIN = 'left join'
+    RIGHT_JOIN = 'right join'
+    FULL_JOIN = 'full join'
+    CROSS_JOIN = 'cross join'
+    NATURAL_JOIN = 'natural join'
+
+    SQL_WILDCARD = '*'
+    SQL_SELECT = 'SELECT'
+    SQL_UNION = 'UNION'
+    SQL_UNION_ALL = 'UNION ALL'
+    SQL_FROM = 'FROM'
+    SQL_WHERE = 'WHERE'
+    SQL_DISTINCT = 'DISTINCT'
+    SQL_GROUP_BY = 'GROUP BY'
+    SQL_ORDER_BY = 'ORDER BY'
+    SQL_HAVING = 'HAVING'
+    SQL_FOR_UPDATE = 'FOR UPDATE'
+    SQL_AND = 'AND'
+    SQL_AS = 'AS'
+    SQL_OR = 'OR'
+    SQL_ON = 'ON'
+    SQL_ASC = 'ASC'
+    SQL_DESC = 'DESC'
+
+    JOIN_TYPES = [INNER_JOIN, LEFT_JOIN, RIGHT_JOIN, FULL_JOIN, CROSS_JOIN, NATURAL_JOIN]
+    UNION_TYPES = [SQL_UNION, SQL_UNION_ALL]
+
+    ORDER_PATTERN = re.compile(r'(.*\W)(' + SQL_ASC + '|' + SQL_DESC + r')\b', re.IGNORECASE + re.DOTALL)
+    ALIAS_PATTERN = re.compile(r'^(.+?)\s+(?:as\s+)?(\w+)$', re.IGNORECASE + re.DOTALL)
+
+    PARTS_INIT = {
+        DISTINCT: False,
+        COLUMNS: [],
+        FROM: {},
+        UNION: [],
+        WHERE: [],
+        GROUP: [],
+        HAVING: [],
+        ORDER: [],
+        LIMIT_COUNT: None,
+        LIMIT_OFFSET: None,
+        FOR_UPDATE: False,
+    }
+
+    # SQL text rendered per query shape, shared by every select
+    RENDER_CACHE_SIZE=256
+    rendered = OrderedDict()
+    rendered_lock = threading.Lock()
+
+    def __init__(self, adapter=None):
+        self.__adapter = adapter
+        self.__parts = self.__initial_parts()
+        self.__bind = []
+
+    @classmethod
+    def __initial_parts(cls, part=None):
+        # Copies, so no two selects ever share (and append to) the same lists
+        if part is not None:
+            value = cls.PARTS_INIT[part]
+            return value.copy() if isinstance(value, (list, dict)) else value
+
+        return {name: cls.__initial_parts(name) for name in cls.PARTS_INIT}
+
+    def reset(self, part=None):
+        if part is None:
+            self.__parts = self.__initial_parts()
+            return self
+
+        if part in self.__parts:
+            self.__parts[part] = self.__initial_parts(part)
+
+        return self
+
+    # Values for placeholders written directly into conditions; they follow the values given to where()/having()
+    def get_bind(self):
+        return self.__collect_bind() + list(self.__bind)
+
+    def bind(self, bind):
+        self.__bind = list(bind)
+        return self
+
+    def distinct(self, flag=True):
+        self.__parts[self.DISTINCT] = flag
+        return self
+
+    def columns(self, columns, correlation_name=None):
+        if correlation_name is None:
+            if len(self.__parts[self.FROM]) == 0:
+                raise ValueError("No table has been specified for the FROM clause")
+
+            correlation_name = next(iter(self.__parts[self.FROM]))
+
+        return self.__table_cols(correlation_name, columns)
+
+    def select_from(self, table_name, columns=SQL_WILDCARD, schema=None):
+        return self.__join(self.FROM, table_name, None, columns, schema)
+
+    def union(self, data_queries, union_type=SQL_UNION):
+        if union_type not in self.UNION_TYPES:
+            raise ValueError("Invalid union type %s" % union_type)
+
+        if isinstance(data_queries, list) or isinstance(data_queries, tuple):
+            for data_query in data_queries:
+                item = [data_query, union_type]
+                self.__parts[self.UNION].append(item)
+
+        return self
+
+    def join(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.join_inner(table_name, condition, columns, schema)
+
+    def join_inner(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join(self.INNER_JOIN, table_name, condition, columns, schema)
+
+    def join_left(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join(self.LEFT_JOIN, table_name, condition, columns, schema)
+
+    def join_right(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join(self.RIGHT_JOIN, table_name, condition, columns, schema)
+
+    def join_full(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join(self.FULL_JOIN, table_name, condition, columns, schema)
+
+    def join_cross(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join(self.CROSS_JOIN, table_name, condition, columns, schema)
+
+    def join_natural(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join(self.NATURAL_JOIN, table_name, condition, columns, schema)
+
+    def join_using(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join_using(self.INNER_JOIN, table_name, condition, columns, schema)
+
+    def join_left_using(self, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        return self.__join_using(self.LEFT_JOIN, table_name, condition, columns, schema)
+
+    def where(self, condition, value=None, value_type=None):
+        self.__parts[self.WHERE].append(self.__where(self.WHERE, condition, value, value_type, True))
+        return self
+
+    def or_where(self, condition, value=None, value_type=None):
+        self.__parts[self.WHERE].append(self.__where(self.WHERE, condition, value, value_type, False))
+        return self
+
+    and_where = where
+
+    def group(self, columns):
+        if isinstance(columns, str):
+            columns = [columns]
+
+        self.__parts[self.GROUP].extend(columns)
+
+        return self
+
+    def having(self, condition, value=None, value_type=None, boolean_type=SQL_AND):
+        self.__parts[self.HAVING].append(self.__where(self.HAVING, condition, value, value_type, boolean_type == self.SQL_AND))
+        return self
+
+    def or_having(self, condition, value=None, value_type=None):
+        return self.having(condition, value, value_type, self.SQL_OR)
+
+    def order(self, columns):
+        if isinstance(columns, str):
+            columns = [columns]
+
+        for column in columns:
+            if column is None:
+                continue
+
+            direction = self.SQL_ASC
+            matches = self.ORDER_PATTERN.search(column)
+            if matches is not None:
+                column = matches.group(1).strip()
+                direction = matches.group(2).upper()
+
+            self.__parts[self.ORDER].append((column, direction))
+
+        return self
+
+    def limit(self, count=None, offset=None):
+        self.__parts[self.LIMIT_COUNT] = int(count) if count is not None else None
+        self.__parts[self.LIMIT_OFFSET] = int(offset) if offset is not None else None
+        return self
+
+    def limit_page(self, page, row_count):
+        page = page if page > 0 else 1
+        row_count = row_count if row_count > 0 else 1
+        self.__parts[self.LIMIT_COUNT] = int(row_count)
+        self.__parts[self.LIMIT_OFFSET] = int(row_count * (page - 1))
+        return self
+
+    def for_update(self, flag=True):
+        self.__parts[self.FOR_UPDATE]=flag
+        return self
+
+    def get_part(self, part):
+        part = part.lower()
+        if part in self.__parts:
+            return self.__parts[part]
+
+        raise ValueError
+
+    def query(self, bind=[]):
+        if len(bind) > 0:
+            self.bind(bind)
+
+        return self.__adapter.query(self)
+
+    def shape(self):
+        # Everything that decides the SQL text, but none of the bound values
+        parts = self.__parts
+
+        return (
+            parts[self.DISTINCT],
+            tuple(parts[self.COLUMNS]),
+            tuple((name, table['join_type'], table['schema'], table['table_name'], table['join_condition']) for name, table in parts[self.FROM].items()),
+            tuple((query.shape() if isinstance(query, DbSelect) else query, union_type) for query, union_type in parts[self.UNION]),
+            tuple(condition[0] for condition in parts[self.WHERE]),
+            tuple(parts[self.GROUP]),
+            tuple(condition[0] for condition in parts[self.HAVING]),
+            tuple(parts[self.ORDER]),
+            parts[self.LIMIT_COUNT] is not None,
+            parts[self.LIMIT_OFFSET] is not None,
+        )
+
+    def assemble(self):
+        key = self.shape()
+
+        with self.rendered_lock:
+            sql = self.rendered.get(key)
+            if sql is not None:
+                self.rendered.move_to_end(key)
+                return sql
+
+        sql = self.SQL_SELECT
+        for render in (self.__render_distinct, self.__render_columns, self.__render_union, self.__render_from, self.__render_where,
+                       self.__render_group, self.__render_having, self.__render_order, self.__render_limit_offset, self.__render_for_update):
+            sql = render(sql)
+
+        with self.rendered_lock:
+            self.rendered[key] = sql
+
+            while len(self.rendered) > self.RENDER_CACHE_SIZE:
+                self.rendered.popitem(last=False)
+
+        return sql
+
+    def __collect_bind(self):
+        # In the order the placeholders appear in the rendered SQL
+        bind = []
+
+        for query, _ in self.__parts[self.UNION]:
+            if isinstance(query, DbSelect):
+                bind.extend(query.get_bind())
+
+        for condition in self.__parts[self.WHERE] + self.__parts[self.HAVING]:
+            bind.extend(condition[1])
+
+        if self.__parts[self.LIMIT_COUNT] is not None:
+            bind.append(self.__parts[self.LIMIT_COUNT])
+        elif self.__parts[self.LIMIT_OFFSET] is not None:
+            bind.append(-1)
+
+        if self.__parts[self.LIMIT_OFFSET] is not None:
+            bind.append(self.__parts[self.LIMIT_OFFSET])
+
+        return bind
+
+    def __join(self, join_type, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        if join_type not in self.JOIN_TYPES and join_type != self.FROM:
+            raise ValueError("Invalid join type %s" % join_type)
+
+        if len(self.__parts[self.UNION]) > 0:
+            raise ValueError("Invalid use of table with %s" % self.SQL_UNION)
+
+        correlation_name, table_name = self.__correlation(table_name)
+
+        if correlation_name in self.__parts[self.FROM]:
+            raise ValueError("You cannot define a correlation name %s more than once" % correlation_name)
+
+        table = {
+            'join_type': join_type,
+            'schema': schema,
+            'table_name': table_name,
+            'join_condition': condition,
+        }
+
+        # Tables in the FROM clause come before every join
+        if join_type == self.FROM:
+            tables = [(correlation_name, table)] + list(self.__parts[self.FROM].items())
+            self.__parts[self.FROM] = dict(tables)
+        else:
+            self.__parts[self.FROM][correlation_name] = table
+
+        return self.__table_cols(correlation_name, columns)
+
+    def __join_using(self, join_type, table_name, condition, columns=SQL_WILDCARD, schema=None):
+        if len(self.__parts[self.FROM]) == 0:
+            raise ValueError("You can only perform a join_using after specifying a FROM table")
+
+        join_correlation, _ = self.__correlation(table_name)
+        from_correlation = next(iter(self.__parts[self.FROM]))
+
+        if isinstance(condition, str):
+            condition = [condition]
+
+        condition = " %s " % self.SQL_AND.join(
+            "%s.%s = %s.%s" % (from_correlation, column, join_correlation, column) for column in condition)
+
+        return self.__join(join_type, table_name, condition.strip(), columns, schema)
+
+    def __correlation(self, name):
+        if isinstance(name, dict):
+            correlation_name, table_name = next(iter(name.items()))
+            return correlation_name, table_name
+
+        matches = self.ALIAS_PATTERN.match(name.strip())
+        if matches is not None:
+            return matches.group(2), matches.group(1)
+
+        return self.__unique_correlation(name), name
+
+    def __unique_correlation(self, name):
+        # Tables named like schema.table are correlated by the table name alone
+        correlation_name = name.split('.')[-1]
+        unique_name = correlation_name
+        count = 2
+
+        while unique_name in self.__parts[self.FROM]:
+            unique_name = "%s_%d" % (correlation_name, count)
+            count += 1
+
+        return unique_name
+
+    def __table_cols(self, correlation_name, columns):
+        if columns is None:
+            return self
+
+        if isinstance(columns, str):
+            columns = [columns]
+        elif isinstance(columns, dict):
+            columns = [(column, alias) for alias, column in columns.items()]
+
+        for column in columns:
+            alias = None
+
+            if isinstance(column, (list, tuple)) and len(column) == 2:
+                column, alias = column
+            elif not isinstance(column, str):
+                raise ValueError("Invalid column %s" % (column,))
+            else:
+                matches = self.ALIAS_PATTERN.match(column.strip())
+                if matches is not None and '(' not in matches.group(2):
+                    column, alias = matches.group(1), matches.group(2)
+
+            column = column.strip()
+            table = correlation_name
+
+            # Expressions are used as they are; qualified names keep their own table
+            if '(' in column:
+                table = None
+            elif '.' in column:
+                table, column = column.split('.', 1)
+
+            self.__parts[self.COLUMNS].append((table, column, alias))
+
+        return self
+
+    def __where(self, part, condition, value=None, value_type=None, where_type=True):
+        if len(self.__parts[self.UNION]) > 0:
+            raise ValueError("Invalid use of where clause with %s" % self.SQL_UNION)
+
+        bind = []
+
+        # Every placeholder in the condition takes the value, lists as one placeholder per item, selects as a subquery
+        if value is not None:
+            value = DbAdapter.cast(value, value_type)
+            pieces = condition.split('?')
+
+            if isinstance(value, DbSelect):
+                placeholder = "(%s)" % value.assemble()
+                values = value.get_bind()
+            elif isinstance(value, (list, tuple)):
+                placeholder = ", ".join("?" * len(value)) if len(value) > 0 else "NULL"
+                values = list(value)
+            else:
+                placeholder = "?"
+                values = [value]
+
+            condition = placeholder.join(pieces)
+            for _ in range(len(pieces) - 1):
+                bind.extend(values)
+
+        condition = "(%s)" % condition
+
+        if len(self.__parts[part]) > 0:
+            condition = "%s %s" % (self.SQL_AND if where_type else self.SQL_OR, condition)
+
+        return condition, bind
+
+    def __render_distinct(self, sql):
+        if self.__parts[self.DISTINCT]:
+            sql += " " + self.SQL_DISTINCT
+
+        return sql
+
+    def __render_columns(self, sql):
+        if len(self.__parts[self.COLUMNS]) == 0:
+            return sql
+
+        columns = []
+
+        for table, column, alias in self.__parts[self.COLUMNS]:
+            rendered = "%s.%s" % (table, column) if table is not None else column
+            if alias is not None:
+                rendered += " %s %s" % (self.SQL_AS, alias)
+
+            columns.append(rendered)
+
+        return sql + " " + ", ".join(columns)
+
+    def __render_union(self, sql):
+        if len(self.__parts[self.UNION]) == 0:
+            return sql
+
+        queries = []
+
+        for index, (query, union_type) in enumerate(self.__parts[self.UNION]):
+            rendered = query.assemble() if isinstance(query, DbSelect) else query
+            queries.append(rendered if index == 0 else "%s %s" % (union_type, rendered))
+
+        return " ".join(queries)
+
+    def __render_from(self, sql):
+        tables = []
+
+        for correlation_name, table in self.__parts[self.FROM].items():
+            table_name = table['table_name']
+            if table['schema'] is not None:
+                table_name = "%s.%s" % (table['schema'], table_name)
+
+            rendered = table_name if correlation_name == table_name else "%s %s %s" % (table_name, self.SQL_AS, correlation_name)
+
+            if table['join_type'] == self.FROM:
+                tables.append((", " if len(tables) > 0 else "") + rendered)
+            else:
+                rendered = "%s %s" % (table['join_type'].upper(), rendered)
+                if table['join_condition'] is not None and table['join_type'] not in (self.CROSS_JOIN, self.NATURAL_JOIN):
+                    rendered += " %s %s" % (self.SQL_ON, table['join_condition'])
+
+                tables.append(" " + rendered)
+
+        if len(tables) > 0:
+            sql += " %s %s" % (self.SQL_FROM, "".join(tables))
+
+        return sql
+
+    def __render_where(self, sql):
+        if len(self.__parts[self.FROM]) > 0 and len(self.__parts[self.WHERE]) > 0:
+            sql += " %s %s" % (self.SQL_WHERE, " ".join(condition[0] for condition in self.__parts[self.WHERE]))
+
+        return sql
+
+    def __render_group(self, sql):
+        if len(self.__parts[self.FROM]) > 0 and len(self.__parts[self.GROUP]) > 0:
+            sql += " %s %s" % (self.SQL_GROUP_BY, ", ".join(self.__parts[self.GROUP]))
+
+        return sql
+
+    def __render_having(self, sql):
+        if len(self.__parts[self.FROM]) > 0 and len(self.__parts[self.HAVING]) > 0:
+            sql += " %s %s" % (self.SQL_HAVING, " ".join(condition[0] for condition in self.__parts[self.HAVING]))
+
+        return sql
+
+    def __render_order(self, sql):
+        if len(self.__parts[self.ORDER]) > 0:
+            sql += " %s %s" % (self.SQL_ORDER_BY, ", ".join("%s %s" % (column, direction) for column, direction in self.__parts[self.ORDER]))
+
+        return sql
+
+    def __render_limit_offset(self, sql):
+        # Bound as parameters, so paging through results reuses one prepared statement
+        if self.__parts[self.LIMIT_COUNT] is not None or self.__parts[self.LIMIT_OFFSET] is not None:
+            sql += " LIMIT ?"
+
+        if self.__parts[self.LIMIT_OFFSET] is not None:
+            sql += " OFFSET ?"
+
+        return sql
+
+    def __render_for_update(self, sql):
+        # SQLite locks the whole database for writes, so there is nothing to render
+        return sql
+
+    def __call__(self, bind=[]):
+        return self.query(bind)
+
+    def __str__(self):
+        return self.assemble()
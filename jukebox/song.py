@@ -1,4 +1,7 @@
 class Song:
+    # Compact, picklable layout used to ship tag data between processes
+    RECORD_FIELDS = ('path', 'last_modified', 'file_size', 'title', 'disc_number', 'track_number', 'album_name', 'artist_name')
+
     def __init__(self):
         self.title = None
         self.search_title = None
@@ -11,4 +14,20 @@ class Song:
         self.artist_id = None
         self.disc_number = None
         self.track_number = None
+        self.file_size = None
         self.last_modified = None
+
+    def to_record(self):
+        if not hasattr(self, 'title'):
+            return None
+
+        return tuple(getattr(self, field, None) for field in self.RECORD_FIELDS)
+
+    @classmethod
+    def from_record(cls, record):
+        song = cls()
+
+        for field, value in zip(cls.RECORD_FIELDS, record):
+            setattr(song, field, value)
+
+        return song
@@ -0,0 +1,81 @@
+import sys
+import os
+import threading
+from collections import namedtuple
+from .cache import LRUCache
+from .playcount import PlayCountTracker
+
+SongFile = namedtuple('SongFile', ['path', 'size', 'mtime_ns', 'mimetype'])
+
+
+# What the stream endpoint needs to answer for a song, without a database query or a stat on the (network) disk
+class SongFileCache:
+    SIZE=4096
+    # Seconds an entry is trusted; the watcher can take until its next full poll to see a file rewritten in place,
+    # and a stale entry could answer a conditional request with the old validators until then
+    TTL=300.0
+
+    MIMETYPES = {
+        '.mp3': 'audio/mpeg',
+        '.aac': 'audio/aac',
+        '.m4a': 'audio/mp4',
+        '.m4b': 'audio/mp4',
+        '.m4p': 'audio/mp4',
+        '.mp4': 'audio/mp4',
+    }
+    DEFAULT_MIMETYPE = 'application/octet-stream'
+
+    def __init__(self, database, size=SIZE, ttl=TTL):
+        self.database = database
+        # Any change the watcher sees drops every entry; anything it has not seen yet expires with the TTL
+        self.cache = LRUCache(size, ttl, lambda: database.generation)
+
+    def get(self, song_id):
+        song_id = int(song_id)
+        song_file = self.cache.get(song_id)
+
+        if song_file is LRUCache.MISSING:
+            generation = self.database.generation
+            song_file = self.load(song_id, self.database.get_song_path_by_song_id(song_id))
+
+            if song_file is not None:
+                self.cache.put(song_id, song_file, generation)
+
+        return song_file
+
+    # Fills the cache for a queue of stream URLs in the background, so building a playback never waits on the disk
+    def warm(self, urls):
+        song_ids = [song_id for song_id in map(PlayCountTracker.get_song_id, urls)
+                    if song_id is not None and self.cache.get(song_id) is LRUCache.MISSING]
+
+        if len(song_ids) > 0:
+            threading.Thread(target=self.load_all, args=(song_ids,), daemon=True).start()
+
+        return self
+
+    def load_all(self, song_ids):
+        generation = self.database.generation
+
+        for song_id, path in self.database.get_song_paths(song_ids).items():
+            song_file = self.load(song_id, path)
+
+            if song_file is not None:
+                self.cache.put(song_id, song_file, generation)
+
+        return self
+
+    def load(self, song_id, path):
+        if path is None:
+            return None
+
+        try:
+            stat = os.stat(path)
+        except OSError as error:
+            print("ERROR reading song %s: %s" % (song_id, error), file=sys.stderr)
+            return None
+
+        return SongFile(path, stat.st_size, stat.st_mtime_ns, self.get_mimetype(path))
+
+    @classmethod
+    def get_mimetype(cls, path):
+        return cls.MIMETYPES.get(os.path.splitext(path)[1].lower(), cls.DEFAULT_MIMETYPE)
@@ -0,0 +1,155 @@
+import os
+import time
+from flask import Response
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date
+
+
+class SongStream:
+    # Bytes read from the file per chunk of the response body, when the server cannot send the file itself
+    CHUNK_SIZE=262144
+
+    # Seconds clients and proxies may reuse a song without asking; after that they revalidate with the ETag
+    MAX_AGE=86400
+
+    def __init__(self, path, mimetype='audio/mpeg', chunk_size=CHUNK_SIZE, file_wrapper=True, max_age=MAX_AGE, size=None,
+                 mtime_ns=None, on_first_byte=None):
+        self.path = path
+        self.mimetype = mimetype
+        self.chunk_size = chunk_size
+        self.file_wrapper = file_wrapper
+        self.max_age = max_age
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # Called with the seconds from the request until the first bytes of the file were read
+        self.on_first_byte = on_first_byte
+        self.started = None
+
+    @classmethod
+    def from_song_file(cls, song_file, **kwargs):
+        return cls(song_file.path, song_file.mimetype, size=song_file.size, mtime_ns=song_file.mtime_ns, **kwargs)
+
+    def get_response(self, request):
+        self.started = time.perf_counter()
+
+        if self.size is None or self.mtime_ns is None:
+            stat = os.stat(self.path)
+            self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+
+        if self.is_not_modified(request, self.get_etag(), self.get_last_modified()):
+            return Response(status=304, headers=self.get_headers())
+
+        # A cached size can lag behind a file rewritten in place, so what is sent is described by the open file
+        file = open(self.path, 'rb', buffering=0)
+
+        try:
+            stat = os.fstat(file.fileno())
+            self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+
+            size = self.size
+            start, stop = 0, size
+            status = 200
+            headers = self.get_headers()
+
+            # Seeks and resumes ask for the rest of the file; multiple ranges are rare enough to answer with all of it
+            byte_range = request.range
+            if byte_range is not None and byte_range.units == 'bytes' and len(byte_range.ranges) == 1 \
+                    and self.is_range_current(request, self.get_etag(), self.get_last_modified()):
+                span = byte_range.range_for_length(size)
+
+                if span is None:
+                    file.close()
+                    headers.add('Content-Range', 'bytes */%d' % size)
+                    return Response(status=416, headers=headers)
+
+                start, stop = span
+                status = 206
+                headers.add('Content-Range', 'bytes %d-%d/%d' % (start, stop - 1, size))
+
+            headers.add('Content-Length', str(stop - start))
+            body = self.get_body(file, request.environ, start, stop, size)
+        except Exception:
+            file.close()
+            raise
+
+        return Response(body, status=status, headers=headers, mimetype=self.mimetype, direct_passthrough=True)
+
+    # Files are only ever replaced whole, so size and modification time identify their contents
+    def get_etag(self):
+        return '%x-%x' % (self.mtime_ns, self.size)
+
+    def get_last_modified(self):
+        return self.mtime_ns // 1000000000
+
+    def get_headers(self):
+        headers = Headers()
+        headers.add('Accept-Ranges', 'bytes')
+        headers.add('ETag', '"%s"' % self.get_etag())
+        headers.add('Last-Modified', http_date(self.get_last_modified()))
+        headers.add('Cache-Control', 'public, max-age=%d' % self.max_age)
+
+        return headers
+
+    @staticmethod
+    def is_not_modified(request, etag, last_modified):
+        # If-Modified-Since only counts when there is no If-None-Match
+        if request.if_none_match:
+            return request.if_none_match.star_tag or request.if_none_match.contains_weak(etag)
+
+        if request.if_modified_since is not None:
+            return last_modified <= request.if_modified_since.timestamp()
+
+        return False
+
+    @staticmethod
+    def is_range_current(request, etag, last_modified):
+        # A range of a file that has changed since the client's copy would splice two versions, so all of it is sent.
+        # Weak validators never match (RFC 9110 13.1.5), but werkzeug drops the W/ prefix, so the raw header is checked
+        if request.headers.get('If-Range', '').strip().startswith('W/'):
+            return False
+
+        if_range = request.if_range
+
+        if if_range.etag is not None:
+            return if_range.etag == etag
+
+        if if_range.date is not None:
+            return if_range.date.timestamp() == last_modified
+
+        return True
+
+    def get_body(self, file, environ, start, stop, size):
+        # Servers with a file wrapper (gunicorn, uWSGI, ...) hand the file to sendfile, so the bytes never pass through
+        # Python. Wrappers send everything from the current offset, so bounded ranges are read here instead
+        wrapper = environ.get('wsgi.file_wrapper')
+        if self.file_wrapper and wrapper is not None and stop == size:
+            file.seek(start)
+
+            if self.on_first_byte is not None and start < stop:
+                os.pread(file.fileno(), 1, start)
+                self.first_byte()
+
+            return wrapper(file, self.chunk_size)
+
+        return self.read(file, start, stop)
+
+    # Unbuffered, since every read is already large and a second buffer would only add a copy
+    def read(self, file, start, stop):
+        with file:
+            file.seek(start)
+            remaining = stop - start
+
+            while remaining > 0:
+                data = file.read(min(self.chunk_size, remaining))
+                if not data:
+                    break
+
+                if remaining == stop - start:
+                    self.first_byte()
+
+                remaining -= len(data)
+                yield data
+
+    def first_byte(self):
+        if self.on_first_byte is not None and self.started is not None:
+            self.on_first_byte(time.perf_counter() - self.started)
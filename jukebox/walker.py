@@ -0,0 +1,132 @@
+import sys
+import os
+from fnmatch import fnmatch
+
+
+class LibraryWalker:
+    # A file with this name adds exclusion patterns for its directory and everything below it
+    IGNORE_FILE_NAME='.jukeboxignore'
+
+    def __init__(self, library_path, extensions, exclude=None, completed_directories=None, on_directory=None):
+        self.library_path = os.path.abspath(library_path)
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.exclude = list(exclude) if exclude is not None else []
+        self.pattern_cache = {}
+
+        # Files in completed directories are yielded without a stat; on_directory is called once a directory is fully listed
+        self.completed_directories = completed_directories if completed_directories is not None else set()
+        self.on_directory = on_directory
+        self.errors = 0
+
+    def __iter__(self):
+        return self.walk()
+
+    def walk(self, directory=None):
+        if directory is None:
+            directories = [(self.library_path, self.exclude)]
+        else:
+            directories = [(os.path.abspath(directory), self.patterns_for(os.path.dirname(os.path.abspath(directory))))]
+
+        while len(directories) > 0:
+            directory, patterns = directories.pop()
+
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as error:
+                print("\nERROR reading directory %s: %s" % (directory, error), file=sys.stderr)
+                self.errors += 1
+                continue
+
+            completed = directory in self.completed_directories
+
+            if any(entry.name == self.IGNORE_FILE_NAME for entry in entries):
+                patterns = patterns + self.read_ignore_file(directory)
+
+            subdirectories = []
+
+            for entry in entries:
+                if self.is_excluded(entry, patterns):
+                    continue
+
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append((entry.path, patterns))
+                        continue
+
+                    if not entry.name.lower().endswith(self.extensions):
+                        continue
+
+                    if completed:
+                        yield entry.path, None
+                        continue
+
+                    # DirEntry caches this, so downstream stages never stat the file again
+                    yield entry.path, entry.stat()
+                except OSError:
+                    continue
+
+            if self.on_directory is not None and not completed:
+                self.on_directory(directory)
+
+            # Reversed so directories come off the stack in listing order
+            directories.extend(reversed(subdirectories))
+
+    def contains(self, path):
+        path = os.path.abspath(path)
+        return path == self.library_path or path.startswith(self.library_path + os.sep)
+
+    def is_supported(self, path):
+        return path.lower().endswith(self.extensions)
+
+    def is_excluded_path(self, path):
+        path = os.path.abspath(path)
+        if not self.contains(path) or path == self.library_path:
+            return False
+
+        directory = os.path.dirname(path)
+        return self.is_excluded(SimpleEntry(path), self.patterns_for(directory)) or self.is_excluded_path(directory)
+
+    def patterns_for(self, directory):
+        if directory in self.pattern_cache:
+            return self.pattern_cache[directory]
+
+        if directory == self.library_path or not self.contains(directory):
+            patterns = list(self.exclude)
+        else:
+            patterns = list(self.patterns_for(os.path.dirname(directory)))
+
+        if os.path.isfile(os.path.join(directory, self.IGNORE_FILE_NAME)):
+            patterns += self.read_ignore_file(directory)
+
+        self.pattern_cache[directory] = patterns
+        return patterns
+
+    def is_excluded(self, entry, patterns):
+        if entry.name == self.IGNORE_FILE_NAME:
+            return True
+
+        if len(patterns) == 0:
+            return False
+
+        relative_path = os.path.relpath(entry.path, self.library_path).replace(os.sep, '/')
+
+        for pattern in patterns:
+            if fnmatch(entry.name, pattern) or fnmatch(relative_path, pattern):
+                return True
+
+        return False
+
+    def read_ignore_file(self, directory):
+        try:
+            with open(os.path.join(directory, self.IGNORE_FILE_NAME)) as ignore_file:
+                lines = [line.strip() for line in ignore_file]
+        except OSError:
+            return []
+
+        return [line for line in lines if line and not line.startswith('#')]
+
+
+class SimpleEntry:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
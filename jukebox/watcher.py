@@ -0,0 +1,615 @@
+import sys
+import os
+import time
+import errno
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from .ingest import IngestPipeline
+from .walker import LibraryWalker
+
+
+class LibraryWatcher:
+    AUTO_MODE='auto'
+    INOTIFY_MODE='inotify'
+    POLL_MODE='poll'
+
+    # Changes are applied once events have been quiet for BATCH_DELAY seconds, or once BATCH_SIZE are pending
+    BATCH_DELAY=1.0
+    BATCH_SIZE=200
+    WAIT_TIMEOUT=0.5
+    # Seconds before a batch that failed to apply, e.g. on a locked database, is tried again
+    RETRY_DELAY=30.0
+
+    # Polling only: directory mtimes are checked every POLL_INTERVAL seconds, which catches new, renamed and deleted
+    # files; every file is re-stat'ed each FULL_POLL_INTERVAL seconds to catch files rewritten in place. Each check
+    # is one stat per directory (or file) on the share, and keeps a spun-down disk awake, so both are kept long
+    POLL_INTERVAL=600.0
+    FULL_POLL_INTERVAL=86400.0
+
+    # inotify never sees changes made by other clients of these filesystems
+    NETWORK_FILESYSTEMS=('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afs', 'ncpfs', 'fuse.sshfs', '9p', 'ceph', 'glusterfs')
+
+    def __init__(self, library, poll_interval=POLL_INTERVAL, full_poll_interval=FULL_POLL_INTERVAL):
+        self.library = library
+        self.database = library.database
+        self.poll_interval = poll_interval
+        self.full_poll_interval = full_poll_interval
+        self.walker = LibraryWalker(library.library_path, IngestPipeline.MP3_EXTENSIONS + IngestPipeline.MP4_EXTENSIONS,
+                                    library.exclude)
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+        self.changed = set()
+        self.deleted = set()
+        self.moved = {}
+        self.last_event = None
+        self.retry_at = 0
+
+    @classmethod
+    def create(cls, library, mode=AUTO_MODE, poll_interval=POLL_INTERVAL, full_poll_interval=FULL_POLL_INTERVAL):
+        if mode == cls.AUTO_MODE:
+            if InotifyWatcher.is_available() and not cls.is_network_path(library.library_path):
+                mode = cls.INOTIFY_MODE
+            else:
+                mode = cls.POLL_MODE
+
+        if mode == cls.INOTIFY_MODE:
+            return InotifyWatcher(library, poll_interval, full_poll_interval)
+        elif mode == cls.POLL_MODE:
+            return PollingWatcher(library, poll_interval, full_poll_interval)
+
+        raise ValueError("Unknown watch mode %s" % mode)
+
+    @classmethod
+    def is_network_path(cls, path):
+        path = os.path.realpath(path)
+        mount_point = ''
+        filesystem = None
+
+        try:
+            with open('/proc/mounts') as mounts:
+                for line in mounts:
+                    fields = line.split()
+                    if len(fields) < 3:
+                        continue
+
+                    # /proc/mounts escapes spaces in mount points as \040
+                    candidate = fields[1].replace('\\040', ' ')
+                    if (path == candidate or path.startswith(candidate.rstrip('/') + '/')) and len(candidate) >= len(mount_point):
+                        mount_point = candidate
+                        filesystem = fields[2]
+        except OSError:
+            return False
+
+        return filesystem in cls.NETWORK_FILESYSTEMS
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        return self
+
+    def run(self):
+        print("Watching %s for changes (%s)" % (self.walker.library_path, self.__class__.__name__), file=sys.stderr)
+
+        try:
+            self.setup()
+
+            while not self.stopped.is_set():
+                # A failing poll or event read is retried rather than ending the watch
+                try:
+                    self.wait(self.WAIT_TIMEOUT)
+                except Exception as error:
+                    print("\nERROR in library watcher, retrying in %.0f seconds: %s" % (self.RETRY_DELAY, error), file=sys.stderr)
+                    self.stopped.wait(self.RETRY_DELAY)
+
+                if self.is_batch_ready():
+                    self.apply_changes()
+
+            self.apply_changes()
+        except Exception as error:
+            print("\nERROR in library watcher: %s" % error, file=sys.stderr)
+        finally:
+            self.teardown()
+
+    def setup(self):
+        pass
+
+    # Checkpoints left by a scan that was interrupted, e.g. by a crash or restart, are resumed rather than cleared
+    def catch_up(self):
+        if not self.is_library_reachable():
+            print("\nLibrary watcher: %s is unreachable, not catching up" % self.walker.library_path, file=sys.stderr)
+            return self
+
+        # A failed scan keeps its checkpoints for the next start; the watcher still picks up what changes from here
+        try:
+            resume = len(self.database.get_scan_checkpoints()) > 0
+            self.library.build_library(incremental=True, resume=resume)
+        except Exception as error:
+            print("\nERROR catching up with %s: %s" % (self.walker.library_path, error), file=sys.stderr)
+
+        return self
+
+    def teardown(self):
+        pass
+
+    def wait(self, timeout):
+        raise NotImplementedError
+
+    def is_batch_ready(self):
+        pending = len(self.changed) + len(self.deleted) + len(self.moved)
+        if pending == 0 or time.monotonic() < self.retry_at:
+            return False
+
+        return pending >= self.BATCH_SIZE or time.monotonic() - self.last_event >= self.BATCH_DELAY
+
+    # An unmounted share usually leaves an empty mount point behind, so an empty library counts as unreachable too
+    def is_library_reachable(self):
+        try:
+            with os.scandir(self.walker.library_path) as entries:
+                return any(True for entry in entries)
+        except OSError:
+            return False
+
+    def is_song_path(self, path):
+        return self.walker.is_supported(path) and not self.walker.is_excluded_path(path)
+
+    def queue_change(self, path):
+        if not self.is_song_path(path):
+            return
+
+        self.deleted.discard(path)
+        self.changed.add(path)
+        self.last_event = time.monotonic()
+
+    def queue_delete(self, path):
+        if not self.walker.is_supported(path):
+            return
+
+        self.changed.discard(path)
+        self.deleted.add(path)
+        self.last_event = time.monotonic()
+
+    def queue_move(self, old_path, new_path):
+        if not self.is_song_path(new_path):
+            return self.queue_delete(old_path)
+
+        self.moved[old_path] = new_path
+        self.last_event = time.monotonic()
+
+    def queue_directory(self, directory):
+        if self.walker.is_excluded_path(directory):
+            return
+
+        for path, stat in self.walker.walk(directory):
+            self.queue_change(path)
+
+    def queue_directory_delete(self, directory):
+        for path in self.database.get_paths_in_directory(directory):
+            self.queue_delete(path)
+
+    def queue_directory_move(self, old_directory, new_directory):
+        old_prefix = old_directory.rstrip(os.sep) + os.sep
+
+        for path in self.database.get_paths_in_directory(old_directory):
+            self.queue_move(path, os.path.join(new_directory, path[len(old_prefix):]))
+
+        # Anything not yet in the database is picked up from its new location
+        self.queue_directory(new_directory)
+
+    def apply_changes(self):
+        changed, deleted, moved = self.changed, self.deleted, self.moved
+        self.changed, self.deleted, self.moved = set(), set(), {}
+
+        # Events are queued on this thread, so nothing newer has arrived when a failed batch is put back
+        try:
+            self.write_changes(set(changed), set(deleted), dict(moved))
+        except Exception as error:
+            print("\nERROR applying library changes, retrying in %.0f seconds: %s" % (self.RETRY_DELAY, error), file=sys.stderr)
+            self.changed, self.deleted, self.moved = changed, deleted, moved
+            self.retry_at = time.monotonic() + self.RETRY_DELAY
+
+        return self
+
+    def write_changes(self, changed, deleted, moved):
+        moves = []
+        for old_path, new_path in moved.items():
+            if new_path in deleted:
+                deleted.add(old_path)
+            elif self.database.is_known_path(old_path) and not self.database.is_known_path(new_path):
+                moves.append((old_path, new_path))
+                changed.discard(new_path)
+            else:
+                deleted.add(old_path)
+                changed.add(new_path)
+
+        deleted = [path for path in deleted if not os.path.exists(path)]
+
+        # Every song of an unreachable share looks deleted, so nothing is removed until it can be listed again
+        if len(deleted) > 0 and not self.is_library_reachable():
+            print("\nLibrary watcher: %s is unreachable, keeping %s missing songs" % (self.walker.library_path, len(deleted)), file=sys.stderr)
+            deleted = []
+
+        if len(moves) > 0:
+            self.database.move_songs(moves)
+
+        songs = []
+        song_count = 0
+
+        for path in changed:
+            try:
+                song = IngestPipeline.read_song(path, None, self.library.tag_engine)
+            except Exception as error:
+                print("\nERROR reading %s: %s" % (path, error), file=sys.stderr)
+                continue
+
+            if song is not None:
+                songs.append(song)
+
+            if len(songs) >= self.BATCH_SIZE:
+                self.database.write_songs(songs)
+                song_count += len(songs)
+                songs = []
+
+        if len(songs) > 0:
+            self.database.write_songs(songs)
+            song_count += len(songs)
+
+        if len(deleted) > 0:
+            self.database.delete_songs_by_path(deleted)
+
+        if len(moves) + song_count + len(deleted) > 0:
+            print("\nLibrary watcher: %s updated, %s moved, %s removed" % (song_count, len(moves), len(deleted)), file=sys.stderr)
+
+        return self
+
+
+class InotifyWatcher(LibraryWatcher):
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+
+    EVENT_HEADER = struct.Struct('iIII')
+    READ_SIZE = 65536
+
+    libc = None
+
+    def __init__(self, library, poll_interval=LibraryWatcher.POLL_INTERVAL, full_poll_interval=LibraryWatcher.FULL_POLL_INTERVAL):
+        super().__init__(library, poll_interval, full_poll_interval)
+        self.fd = None
+        self.watches = {}
+        self.move_sources = {}
+
+    @classmethod
+    def get_libc(cls):
+        if cls.libc is None:
+            cls.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+        return cls.libc
+
+    @classmethod
+    def is_available(cls):
+        if not sys.platform.startswith('linux'):
+            return False
+
+        try:
+            return hasattr(cls.get_libc(), 'inotify_init1')
+        except OSError:
+            return False
+
+    def setup(self):
+        self.fd = self.get_libc().inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        try:
+            self.add_watches(self.walker.library_path)
+        except OSError as error:
+            if error.errno != errno.ENOSPC:
+                raise
+
+            print("\nLibrary watcher: %s, falling back to polling" % error.strerror, file=sys.stderr)
+            self.stopped.set()
+            self.library.watcher = PollingWatcher(self.library, self.poll_interval, self.full_poll_interval).start()
+            return
+
+        # Catch up on anything that changed while the server was not running; new events queue up meanwhile
+        self.catch_up()
+
+    def teardown(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def add_watches(self, directory):
+        directories = [directory]
+
+        while len(directories) > 0:
+            directory = directories.pop()
+
+            if self.walker.is_excluded_path(directory):
+                continue
+
+            wd = self.get_libc().inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, "Out of inotify watches, raise fs.inotify.max_user_watches or use polling")
+                continue
+
+            self.watches[wd] = directory
+
+            try:
+                with os.scandir(directory) as entries:
+                    directories.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return
+
+        data = os.read(self.fd, self.READ_SIZE)
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            self.handle_event(wd, mask, cookie, name)
+
+    def handle_event(self, wd, mask, cookie, name):
+        if mask & self.IN_Q_OVERFLOW:
+            print("\nLibrary watcher: event queue overflowed, rescanning", file=sys.stderr)
+            self.library.build_library(incremental=True)
+            return
+
+        if mask & self.IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+
+        directory = self.watches.get(wd)
+        if directory is None or mask & self.IN_DELETE_SELF:
+            return
+
+        path = os.path.join(directory, name)
+        is_directory = mask & self.IN_ISDIR
+
+        if name == LibraryWalker.IGNORE_FILE_NAME:
+            self.walker.pattern_cache = {}
+            return
+
+        if mask & self.IN_MOVED_FROM:
+            self.move_sources[cookie] = (path, is_directory)
+            self.last_event = time.monotonic()
+        elif mask & self.IN_MOVED_TO:
+            source = self.move_sources.pop(cookie, None)
+
+            if is_directory:
+                self.add_watches(path)
+                if source is not None:
+                    self.rename_watches(source[0], path)
+                    self.queue_directory_move(source[0], path)
+                else:
+                    self.queue_directory(path)
+            elif source is not None:
+                self.queue_move(source[0], path)
+            else:
+                self.queue_change(path)
+        elif mask & self.IN_CREATE and is_directory:
+            # Files can land in the directory before its watch exists
+            self.add_watches(path)
+            self.queue_directory(path)
+        elif mask & self.IN_CLOSE_WRITE:
+            self.queue_change(path)
+        elif mask & self.IN_DELETE:
+            if is_directory:
+                self.queue_directory_delete(path)
+            else:
+                self.queue_delete(path)
+
+    def rename_watches(self, old_directory, new_directory):
+        old_prefix = old_directory + os.sep
+
+        for wd, directory in list(self.watches.items()):
+            if directory == old_directory:
+                self.watches[wd] = new_directory
+            elif directory.startswith(old_prefix):
+                self.watches[wd] = os.path.join(new_directory, directory[len(old_prefix):])
+
+    def apply_changes(self):
+        # A move source without a matching destination left the library
+        for path, is_directory in self.move_sources.values():
+            if is_directory:
+                self.queue_directory_delete(path)
+            else:
+                self.queue_delete(path)
+
+        self.move_sources = {}
+
+        return super().apply_changes()
+
+
+class PollingWatcher(LibraryWatcher):
+    def __init__(self, library, poll_interval=LibraryWatcher.POLL_INTERVAL, full_poll_interval=LibraryWatcher.FULL_POLL_INTERVAL):
+        super().__init__(library, poll_interval, full_poll_interval)
+        self.directories = {}
+        self.files = {}
+        # Directories that could not be listed during the current full poll
+        self.errors = 0
+        self.next_poll = 0
+        self.next_full_poll = 0
+
+    def setup(self):
+        # Catching up goes through the ingest pipeline, with its reader pool, bulk loads and checkpoints, rather
+        # than reading every new song on this thread; afterwards the database describes the files on disk
+        self.catch_up()
+        self.files = self.database.get_song_fingerprints()
+        self.full_poll(check_files=False)
+
+    def wait(self, timeout):
+        self.stopped.wait(timeout)
+        now = time.monotonic()
+
+        if now >= self.next_full_poll:
+            self.full_poll()
+        elif now >= self.next_poll:
+            self.poll()
+
+    def full_poll(self, check_files=True):
+        seen = set()
+        self.directories = {}
+        self.errors = 0
+
+        for directory in self.scan_directories(self.walker.library_path):
+            paths = self.scan_files(directory, check_files)
+            if paths is not None:
+                seen.update(paths)
+
+        self.next_poll = time.monotonic() + self.poll_interval
+        # None turns the full poll off after startup, for shares that should be left to spin down
+        self.next_full_poll = time.monotonic() + self.full_poll_interval if self.full_poll_interval is not None else float('inf')
+
+        # Songs in a directory that could not be listed are not known to be gone, so nothing is removed this pass,
+        # and the full poll is retried with the next poll
+        if self.errors > 0 or not self.is_library_reachable():
+            print("\nLibrary watcher: %s directories could not be listed, not removing songs" % max(self.errors, 1), file=sys.stderr)
+            self.next_full_poll = self.next_poll
+            return
+
+        for path in set(self.files) - seen:
+            self.forget(path)
+
+    def poll(self):
+        self.next_poll = time.monotonic() + self.poll_interval
+
+        if not self.is_library_reachable():
+            return
+
+        for directory, (last_modified, paths) in list(self.directories.items()):
+            if directory not in self.directories:
+                continue
+
+            try:
+                modified = os.stat(directory).st_mtime
+            except OSError:
+                if self.is_removed(directory):
+                    self.forget_directory(directory)
+                continue
+
+            if modified == last_modified:
+                continue
+
+            for subdirectory in self.scan_subdirectories(directory):
+                if subdirectory not in self.directories:
+                    for new_directory in self.scan_directories(subdirectory):
+                        self.scan_files(new_directory)
+
+            seen = self.scan_files(directory)
+            if seen is None:
+                continue
+
+            for path in paths - seen:
+                self.forget(path)
+
+    # A directory is only gone when its parent can be listed without it; a failing stat alone may be the network
+    def is_removed(self, directory):
+        try:
+            names = os.listdir(os.path.dirname(directory))
+        except OSError:
+            return False
+
+        return os.path.basename(directory) not in names
+
+    def scan_directories(self, directory):
+        directories = []
+        pending = [directory]
+
+        while len(pending) > 0:
+            directory = pending.pop()
+            if self.walker.is_excluded_path(directory):
+                continue
+
+            directories.append(directory)
+            pending.extend(self.scan_subdirectories(directory))
+
+        return directories
+
+    def scan_subdirectories(self, directory):
+        try:
+            with os.scandir(directory) as entries:
+                return [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            self.errors += 1
+            return []
+
+    # Without check_files only songs missing from self.files are stat'ed, for when those are known to be current.
+    # Returns None for a directory that could not be listed, whose songs are neither seen nor gone
+    def scan_files(self, directory, check_files=True):
+        paths = set()
+
+        try:
+            modified = os.stat(directory).st_mtime
+            entries = list(os.scandir(directory))
+        except OSError:
+            self.errors += 1
+            return None
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False) or not self.is_song_path(entry.path):
+                    continue
+
+                if not check_files and entry.path in self.files:
+                    paths.add(entry.path)
+                    continue
+
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            paths.add(entry.path)
+            fingerprint = (stat.st_mtime, stat.st_size)
+
+            if self.files.get(entry.path) != fingerprint:
+                self.files[entry.path] = fingerprint
+                self.queue_change(entry.path)
+
+        self.directories[directory] = (modified, paths)
+        return paths
+
+    def forget(self, path):
+        self.files.pop(path, None)
+        self.queue_delete(path)
+
+    def forget_directory(self, directory):
+        prefix = directory + os.sep
+
+        for known_directory in list(self.directories):
+            if known_directory == directory or known_directory.startswith(prefix):
+                for path in self.directories.pop(known_directory)[1]:
+                    self.forget(path)